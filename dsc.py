@@ -2,20 +2,440 @@ import numpy as np
 import scipy.signal as ss
 import itertools
 import re
+import warnings
 from util import get_encoding_type, print_summary_stats, si_intersect, \
-    filter_control
+    filter_control, LRUCache
 
 SAVGOL_POLYORDER = 3
+# Derivative and integral arrays kept per DSCData for recently used
+# smoothing settings and regions
+DERIV_CACHE_ENTRIES = 256
+DERIV_CACHE_BYTES = 1 << 27
+# Bytes per sample the cache may hold on runs too long for DERIV_CACHE_BYTES;
+# a first derivative takes 24 (the row and two time derivatives)
+DERIV_CACHE_SAMPLE_BYTES = 128
+# Runs at least this long have derivatives computed around analysed regions
+# rather than over the whole curve, until the whole curve is needed
+LOCAL_DERIV_MIN_SAMPLES = 1 << 18
+# Positions read from the derivative further apart than this are computed as
+# separate ranges
+LOCAL_DERIV_GAP = 1 << 10
 
 np.seterr(divide='ignore', invalid='ignore')
 
+# np.trapz was renamed in numpy 2
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+COLUMNS = ('Index', 't', 'Heatflow', 'Tr')
+COLUMN_DTYPES = {'Index': np.int64, 't': np.float64, 'Heatflow': np.float64,
+    'Tr': np.float64}
+
+# Versions given to DSCData as their columns change; unique across instances
+# so that results can be cached by version
+DATA_VERSIONS = itertools.count(1)
+
+# Sample column of DSCData, held as a read-only view of a single array. A
+# column can be supplied lazily by the column_loader of its DSCData (e.g. from
+# a project file), in which case it is only read on first access. Assigning a
+# column gives the DSCData a new version.
+class Column:
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return obj.columns[self.name]
+        except KeyError:
+            if obj.column_loader is None:
+                raise AttributeError(self.name)
+            self.store(obj, obj.column_loader(self.name))
+            return obj.columns[self.name]
+
+    def __set__(self, obj, value):
+        self.store(obj, value)
+        obj.version = next(DATA_VERSIONS)
+
+    def store(self, obj, value):
+        value = np.asanyarray(value, dtype=COLUMN_DTYPES[self.name]).view()
+        value.flags.writeable = False
+        obj.columns[self.name] = value
+
+# Former names of the columns
+class ColumnAlias:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self.name)
+
+# Position in the columns of the i-th sample of a selection made by
+# DSCData.tr_selection
+def selection_index(sel, i):
+    if isinstance(sel, slice):
+        return sel.start + i
+    return sel[i]
+
+def selection_size(sel):
+    if isinstance(sel, slice):
+        return sel.stop - sel.start
+    return len(sel)
+
+# Samples gathered at a time by the batched analyses
+MANY_BATCH_SAMPLES = 1 << 16
+
+# Concatenated positions of the slices starts[i]:stops[i], and the offsets of
+# each slice's positions in them
+def gather(starts, stops):
+    lengths = stops - starts
+    offsets = np.r_[0, np.cumsum(lengths)]
+    idx = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+    return idx, offsets
+
+# For gathered slices (see gather), none of them empty, returns the position
+# of the first minimum of values within each slice, as np.argmin would
+def segment_argmin(values, idx, offsets):
+    mins = np.repeat(np.minimum.reduceat(values, offsets[:-1]),
+        np.diff(offsets))
+    hit = (values == mins) | (np.isnan(values) & np.isnan(mins))
+    return np.minimum.reduceat(np.where(hit, idx, np.iinfo(idx.dtype).max),
+        offsets[:-1])
+
+# Samples per side over which the heating rate is taken when classifying
+# samples into segments
+SEGMENT_RATE_SPAN = 2
+# Slowest rate (°C/s) counted as a ramp rather than an isotherm
+ISOTHERM_RATE = 0.5 / 60
+# Shorter runs of samples are merged into the preceding segment
+MIN_SEGMENT_SAMPLES = 10
+SEGMENT_KINDS = ('cool', 'iso', 'heat')
+
+# A heating, cooling or isothermal part of a run: samples start..stop-1.
+# Region queries bisect sorted_tr, which is Tr itself (or reversed) when Tr
+# is monotonic within the segment and otherwise a sorted copy.
+class Segment:
+    __slots__ = ('kind', 'start', 'stop', 'tr', 'direction', 'order',
+        'sorted_tr')
+
+    def __init__(self, kind, start, stop, Tr):
+        self.kind = kind
+        self.start = start
+        self.stop = stop
+        self.tr = Tr[start:stop]
+        self.order = None
+        steps = np.diff(self.tr)
+        if np.all(steps >= 0):
+            self.direction = 1
+            self.sorted_tr = self.tr
+        elif np.all(steps <= 0):
+            self.direction = -1
+            self.sorted_tr = self.tr[::-1]
+        else:
+            self.direction = 0
+            self.order = np.argsort(self.tr, kind='stable')
+            self.sorted_tr = self.tr[self.order]
+
+    @property
+    def slice(self):
+        return slice(self.start, self.stop)
+
+    # Values of a column over the segment in the order of sorted_tr
+    def sorted_values(self, values):
+        values = values[self.start:self.stop]
+        if self.direction == 0:
+            return values[self.order]
+        return values if self.direction == 1 else values[::-1]
+
+    # Range a:b of sorted_tr with lo < Tr < hi; lo and hi may be arrays
+    def bounds(self, lo, hi):
+        a = np.searchsorted(self.sorted_tr, lo, 'right')
+        return a, np.maximum(a, np.searchsorted(self.sorted_tr, hi, 'left'))
+
+    # Start and stop in the columns of the samples sorted_tr[a:b] of a
+    # monotonic segment
+    def slice_bounds(self, a, b):
+        if self.direction == 1:
+            return self.start + a, self.start + b
+        n = len(self.tr)
+        return self.start + n - b, self.start + n - a
+
+    # Returns the samples with lo < Tr < hi as a slice of the columns if Tr
+    # is monotonic here, otherwise as an array of positions
+    def select(self, lo, hi):
+        a, b = (int(x) for x in self.bounds(lo, hi))
+        if self.direction == 0:
+            return self.start + np.sort(self.order[a:b])
+        return slice(*self.slice_bounds(a, b))
+
+    # select for arrays of lo and hi, as the starts and stops of the slices;
+    # monotonic segments only
+    def select_many(self, lo, hi):
+        return self.slice_bounds(*self.bounds(lo, hi))
+
+    # Index in sorted_tr of the samples at positions pos in a monotonic
+    # segment (and the inverse)
+    def sorted_index(self, pos):
+        return pos if self.direction == 1 else len(self.tr) - 1 - pos
+
+    # Position in a monotonic segment of the first sample (in time) with the
+    # same Tr as sorted_tr[k]
+    def first_position(self, k):
+        if self.direction == 1:
+            return np.searchsorted(self.sorted_tr, self.sorted_tr[k], 'left')
+        return len(self.tr) - \
+            np.searchsorted(self.sorted_tr, self.sorted_tr[k], 'right')
+
+    # Positions in a monotonic segment of the samples with Tr closest to each
+    # of trs; the first such sample on ties, as with np.argmin
+    def nearest_many(self, trs):
+        n = len(self.tr)
+        i = np.searchsorted(self.sorted_tr, trs)
+        below = np.clip(i - 1, 0, n - 1)
+        above = np.minimum(i, n - 1)
+        d_below = np.abs(self.sorted_tr[below] - trs)
+        d_above = np.abs(self.sorted_tr[above] - trs)
+        below = self.first_position(below)
+        above = self.first_position(above)
+        pos = np.where(d_below < d_above, below,
+            np.where(d_above < d_below, above, np.minimum(below, above)))
+        return np.where(np.isnan(trs), 0, pos)
+
+    # Returns the position in the segment of the sample with Tr closest to
+    # tr and the distance to it
+    def nearest(self, tr):
+        if np.isnan(tr):
+            return 0, np.nan
+        if self.direction != 0:
+            j = int(self.nearest_many(tr))
+            return j, abs(self.tr[j] - tr)
+        n = len(self.tr)
+        i = int(np.searchsorted(self.sorted_tr, tr))
+        dist = min(abs(self.sorted_tr[j] - tr) for j in (i - 1, i)
+            if 0 <= j < n)
+        # Ties within the sorted copy: take the earliest sample
+        lo, hi = np.searchsorted(self.sorted_tr, [tr - 2*dist, tr + 2*dist])
+        close = self.order[max(lo - 1, 0):hi + 1]
+        close = close[np.abs(self.tr[close] - tr) == dist]
+        return int(close.min()), dist
+
+    # Fractional position of Tr == tr within the segment, interpolated
+    # linearly between the samples either side of it
+    def position(self, tr):
+        if self.direction == 0:
+            return float(self.nearest(tr)[0])
+        n = len(self.tr)
+        pos = np.interp(tr, self.sorted_tr, np.arange(n, dtype=np.float64))
+        return float(pos if self.direction == 1 else n - 1 - pos)
+
+# Kind (index into SEGMENT_KINDS) of heating rates
+def rate_kind(rate):
+    return (rate > ISOTHERM_RATE).astype(np.int8) - \
+        (rate < -ISOTHERM_RATE) + 1
+
+# Splits a run into segments by the sign of dTr/dt. Stretches of runs too
+# short to be segments (e.g. where Tr is coarsely quantised) are classified
+# as a whole, by their overall rate, or else joined to the segment before.
+def detect_segments(t, Tr):
+    n = len(Tr)
+    if n == 0:
+        return []
+    i = np.arange(n)
+    ahead = np.minimum(i + SEGMENT_RATE_SPAN, n - 1)
+    behind = np.maximum(i - SEGMENT_RATE_SPAN, 0)
+    kind = rate_kind((Tr[ahead] - Tr[behind]) / (t[ahead] - t[behind]))
+    bounds = np.flatnonzero(np.diff(kind)) + 1
+    starts = np.r_[0, bounds]
+    stops = np.r_[bounds, n]
+
+    runs = []
+    def add(k, start, stop):
+        if runs and runs[-1][0] in (k, None):
+            runs[-1][0] = k
+            runs[-1][2] = stop
+        else:
+            runs.append([k, start, stop])
+    def add_short(start, stop):
+        if stop - start >= MIN_SEGMENT_SAMPLES:
+            add(int(rate_kind(np.array((Tr[stop - 1] - Tr[start]) /
+                (t[stop - 1] - t[start])))), start, stop)
+        elif runs:
+            runs[-1][2] = stop
+        else:
+            runs.append([None, start, stop])
+
+    short = None
+    for k, start, stop in zip(kind[starts], starts, stops):
+        if stop - start < MIN_SEGMENT_SAMPLES:
+            short = (short[0] if short else start, stop)
+            continue
+        if short:
+            add_short(*short)
+            short = None
+        add(k, start, stop)
+    if short:
+        add_short(*short)
+    if runs[0][0] is None:
+        runs[0][0] = 1
+    return [Segment(SEGMENT_KINDS[k], int(start), int(stop), Tr)
+        for k, start, stop in runs]
+
+# np.gradient(y, x) with the formula for unevenly spaced x always used, so
+# that a part of a curve gets the same derivative as the whole of it however
+# evenly either happens to be spaced
+def gradient(y, x):
+    dx = np.diff(x)
+    ret = np.empty(len(y))
+    ret[[0, -1]] = (y[1] - y[0])/dx[0], (y[-1] - y[-2])/dx[-1]
+    dx1, dx2 = dx[:-1], dx[1:]
+    a = -dx2/(dx1*(dx1 + dx2))
+    b = (dx2 - dx1)/(dx1*dx2)
+    c = dx1/(dx2*(dx1 + dx2))
+    ret[1:-1] = a*y[:-2] + b*y[1:-1] + c*y[2:]
+    return ret
+
+# Whether derivatives of a segment are smoothed with the given window
+def savgol_applies(seg, window):
+    return seg.kind != 'iso' and seg.stop - seg.start >= window
+
+def segment_time_step(t, seg):
+    return (t[seg.stop - 1] - t[seg.start])/(seg.stop - seg.start - 1)
+
+# Heatflow1Deriv of a DSCData for reading by index (an int, a slice or an
+# array of positions). For long runs whose whole derivative has not been
+# computed (e.g. for plotting), only clusters of samples around the positions
+# read are differentiated, so analyses cost the same however long the run.
+class RegionDeriv1:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, index):
+        full = self.data.full_deriv1()
+        if full is not None:
+            return full[index]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.data.Tr))
+            return self.data.deriv1_range(start, max(start, stop))[::step]
+        index = np.asarray(index)
+        if index.ndim == 0:
+            return self.data.deriv1_range(int(index), int(index) + 1)[0]
+        if index.size == 0:
+            return np.empty(index.shape)
+        # Positions further apart than LOCAL_DERIV_GAP are read from separate
+        # ranges
+        u = np.unique(index)
+        cuts = np.flatnonzero(np.diff(u) > LOCAL_DERIV_GAP) + 1
+        starts = u[np.r_[0, cuts]]
+        stops = u[np.r_[cuts - 1, len(u) - 1]] + 1
+        values = [self.data.deriv1_range(int(a), int(b))
+            for a, b in zip(starts, stops)]
+        offsets = np.r_[0, np.cumsum(stops - starts)[:-1]]
+        cluster = np.searchsorted(starts, index, 'right') - 1
+        return np.concatenate(values)[offsets[cluster] + index -
+            starts[cluster]]
+
+# Heatflow and its first and second derivatives with respect to Tr, smoothed
+# by a Savitzky-Golay filter of the given window, as rows 0-2 of one array.
+# Samples are evenly spaced in time rather than in Tr, so within each ramp
+# the filter differentiates Heatflow and Tr with respect to t and the chain
+# rule gives dH/dTr = H'/Tr' and d2H/dTr2 = (H''Tr' - H'Tr'')/Tr'^3. Rows and
+# time derivatives are allocated and computed on first use and shared between
+# the rows. Isotherms and segments shorter than the window get plain
+# gradients. The stack is kept in its data's cache under key and put there
+# again as it grows, so that the cache counts the bytes it holds.
+class DerivativeStack:
+    __slots__ = ('data', 'window', 'key', 'rows', 'time_derivs')
+
+    def __init__(self, data, window, key):
+        self.data = data
+        self.window = window
+        self.key = key
+        self.rows = {}
+        self.time_derivs = {}
+
+    @property
+    def nbytes(self):
+        # Copied first, as other threads may be adding to them
+        return sum(a.nbytes for a in list(self.rows.values()) +
+            list(self.time_derivs.values()))
+
+    def smoothed(self, seg):
+        return savgol_applies(seg, self.window)
+
+    # k-th derivative of a column with respect to t over the smoothed
+    # segments, NaN elsewhere
+    def savgol(self, col, k):
+        ret = np.full(len(self.data.t), np.nan)
+        values = getattr(self.data, col)
+        for seg in filter(self.smoothed, self.data.get_segments()):
+            ret[seg.slice] = ss.savgol_filter(values[seg.slice],
+                self.window, SAVGOL_POLYORDER, deriv=k,
+                delta=segment_time_step(self.data.t, seg))
+        return ret
+
+    # savgol, kept for the rows that share it
+    def time_deriv(self, col, k):
+        ret = self.time_derivs.get((col, k))
+        if ret is None:
+            ret = self.savgol(col, k)
+            self.time_derivs[(col, k)] = ret
+        return ret
+
+    def order(self, k):
+        row = self.rows.get(k)
+        if row is None:
+            if k == 0:
+                row = self.savgol('Heatflow', 0)
+            elif k == 1:
+                row = self.time_deriv('Heatflow', 1) / \
+                    self.time_deriv('Tr', 1)
+            else:
+                tr1 = self.time_deriv('Tr', 1)
+                row = (self.time_deriv('Heatflow', 2)*tr1 -
+                    self.time_deriv('Heatflow', 1)*self.time_deriv('Tr', 2)) \
+                    / tr1**3
+            for seg in self.data.get_segments():
+                if self.smoothed(seg):
+                    continue
+                # Row 0 is Heatflow outside the smoothed segments
+                if k == 0:
+                    row[seg.slice] = self.data.Heatflow[seg.slice]
+                elif seg.stop - seg.start >= 2:
+                    row[seg.slice] = gradient(self.data.Heatflow[seg.slice]
+                        if k == 1 else self.order(1)[seg.slice], seg.tr)
+            row.flags.writeable = False
+            self.rows[k] = row
+            self.data.derivs.put(self.key, self)
+        return row
+
 #################### DSC data base class ####################
 class DSCData:
-    def __init__(self):
-        self.Index = []
-        self.t = []
-        self.Heatflow = []
-        self.Tr = []
+    __slots__ = ('columns', 'column_loader', 'name', 'notes',
+        'savgol_1_window', 'savgol_1_enabled', 'derivs', 'segments_of',
+        'version', '__weakref__')
+
+    Index = Column()
+    t = Column()
+    Heatflow = Column()
+    Tr = Column()
+    np_Index = ColumnAlias('Index')
+    np_t = ColumnAlias('t')
+    np_Heatflow = ColumnAlias('Heatflow')
+    np_Tr = ColumnAlias('Tr')
+
+    def __init__(self, column_loader=None):
+        self.columns = {}
+        self.column_loader = column_loader
+        self.version = next(DATA_VERSIONS)
+        self.derivs = LRUCache(DERIV_CACHE_ENTRIES, DERIV_CACHE_BYTES)
+        self.segments_of = None
+        if column_loader is None:
+            for col in COLUMNS:
+                setattr(self, col, np.empty(0))
         self.name = ''
         self.notes = ''
 
@@ -27,31 +447,226 @@ class DSCData:
         return (self.Tr > min(data_click_x, data_release_x)) & \
             (self.Tr < max(data_click_x, data_release_x))
 
+    # Heating, cooling and isothermal segments of the run, detected once per
+    # t/Tr columns
+    def get_segments(self):
+        if self.segments_of is None or self.segments_of[0] is not self.t or \
+                self.segments_of[1] is not self.Tr:
+            self.segments_of = (self.t, self.Tr,
+                detect_segments(self.t, self.Tr))
+        return self.segments_of[2]
+
+    # Id of the segment an analysis over x1..x2 applies to: the ramp with the
+    # most samples in the range
+    def segment_for(self, x1, x2):
+        if not self.get_segments():
+            return None
+        return int(self.segments_for([x1], [x2])[0])
+
+    # segment_for over arrays of region bounds
+    def segments_for(self, x1, x2):
+        lo, hi = np.minimum(x1, x2), np.maximum(x1, x2)
+        scores = []
+        for seg in self.get_segments():
+            a, b = seg.bounds(lo, hi)
+            scores.append(b - a + (seg.kind != 'iso')*(len(self.Tr) + 1))
+        return np.argmax(scores, axis=0)
+
+    # Returns the samples of a segment (by default the one chosen by
+    # segment_for) with x1 < Tr < x2 (either order), as something that indexes
+    # the columns; see Segment.select
+    def tr_selection(self, x1, x2, segment=None):
+        if segment is None:
+            segment = self.segment_for(x1, x2)
+            if segment is None:
+                return slice(0, 0)
+        return self.get_segments()[segment].select(min(x1, x2), max(x1, x2))
+
+    #################### Sample lookups ####################
+    # Position of the sample with Tr closest to tr, in the given segment or
+    # else the whole run. Tr is bisected within segments. With interpolate,
+    # returns the fractional position where Tr == tr instead (see
+    # sample_at).
+    def nearest_tr_idx(self, tr, segment=None, interpolate=False):
+        segments = self.get_segments()
+        if segment is None:
+            if not segments:
+                raise ValueError('No samples')
+            segment = min(range(len(segments)), key=lambda i: (
+                np.nan_to_num(segments[i].nearest(tr)[1], nan=np.inf), i))
+        seg = segments[segment]
+        if interpolate:
+            return seg.start + seg.position(tr)
+        return seg.start + seg.nearest(tr)[0]
+
+    # Position of the sample in sel (as returned by tr_selection) with
+    # Heatflow closest to hf
+    def nearest_heatflow_idx(self, hf, sel):
+        return int(selection_index(sel,
+            np.argmin(np.abs(self.Heatflow[sel] - hf))))
+
+    # (Tr, Heatflow) at a fractional position, interpolated linearly
+    def sample_at(self, pos):
+        i = min(int(pos), len(self.Tr) - 2)
+        frac = pos - i
+        return ((1 - frac)*self.Tr[i] + frac*self.Tr[i + 1],
+            (1 - frac)*self.Heatflow[i] + frac*self.Heatflow[i + 1])
+
     def max_tr(self):
-        return (max(self.Tr))
+        return self.Tr.max()
 
     def deriv_of(self, idx):
-        return self.Heatflow1Deriv[idx]
+        return self.deriv1[idx]
 
     def offset_of(self, idx, deriv):
         return (self.Heatflow[idx] - deriv*self.np_Tr[idx])
 
     def to_dict(self):
-        return {'Index': self.Index, 't': self.t, 'Heatflow': self.Heatflow, 
-                'Tr': self.Tr, 'name': self.name, 'notes': self.notes}
+        return {'Index': np.asarray(self.Index).tolist(),
+                't': np.asarray(self.t).tolist(),
+                'Heatflow': np.asarray(self.Heatflow).tolist(),
+                'Tr': np.asarray(self.Tr).tolist(),
+                'name': self.name, 'notes': self.notes}
 
-    # Prepare for extra analysis (Tg, peak/enthalpy)
+    # Prepare for extra analysis (Tg, peak/enthalpy). The derivative is
+    # computed on first use anyway; this only does so ahead of time, and not
+    # for long runs, whose analyses only compute it around their regions.
     def prepare_extra(self):
-        self.np_Index = np.array(self.Index)
-        self.np_t = np.array(self.t)
-        self.np_Heatflow = np.array(self.Heatflow)
-        self.np_Tr = np.array(self.Tr)
+        if len(self.Tr) < LOCAL_DERIV_MIN_SAMPLES:
+            self.Heatflow1Deriv
 
-        self.Heatflow1Deriv = np.gradient(
-            self.np_Heatflow, self.np_Tr)
+    # dHeatflow/dTr for the current smoothing settings. Derivatives are kept
+    # per settings (and data version) so that returning to earlier settings
+    # is a lookup.
+    @property
+    def Heatflow1Deriv(self):
         if self.savgol_1_enabled:
-            self.Heatflow1Deriv = ss.savgol_filter(self.Heatflow1Deriv,
-                self.savgol_1_window, SAVGOL_POLYORDER)
+            return self.derivative_stack(self.savgol_1_window).order(1)
+        key = ('raw', self.version)
+        deriv = self.derivs.get(key)
+        if deriv is None:
+            deriv = self.compute_deriv1()
+            deriv.flags.writeable = False
+            self.derivs.put(key, deriv)
+        return deriv
+
+    # d2Heatflow/dTr2, smoothed with the current window (or the smallest one
+    # if smoothing is off)
+    @property
+    def Heatflow2Deriv(self):
+        return self.derivative_stack(self.savgol_1_window
+            if self.savgol_1_enabled else SAVGOL_POLYORDER + 1).order(2)
+
+    # Trapezoidal integral of Heatflow over t from the first sample to each
+    def heatflow_integral(self):
+        key = ('integral', self.version)
+        ret = self.derivs.get(key)
+        if ret is None:
+            ret = np.zeros(len(self.t))
+            np.cumsum(np.diff(self.t)*(self.Heatflow[1:] +
+                self.Heatflow[:-1])/2, out=ret[1:])
+            ret.flags.writeable = False
+            self.derivs.put(key, ret)
+        return ret
+
+    # Area between Heatflow and a baseline (slope, offset) linear in t from
+    # sample l_idx to sample r_idx, as trapezoid() over the samples between
+    # them would give, in constant time. The trapezoidal rule is exact for
+    # the baseline. Positions may be arrays of regions.
+    def region_area(self, l_idx, r_idx, baseline=(0, 0)):
+        slope, offset = baseline
+        integral = self.heatflow_integral()
+        t_l, t_r = self.t[l_idx], self.t[r_idx]
+        area = integral[r_idx] - integral[l_idx] - \
+            (t_r - t_l)*(slope*(t_l + t_r)/2 + offset)
+        # A single sample has no area whatever the baseline
+        return np.where(np.equal(l_idx, r_idx), 0.0, area)[()]
+
+    # A DSCData sharing the columns and cached results of this one, with
+    # smoothing settings of its own fixed at their current values, so that
+    # it can be analysed on another thread while these change
+    def snapshot(self):
+        ret = DSCData.__new__(DSCData)
+        for slot in DSCData.__slots__:
+            if slot != '__weakref__':
+                setattr(ret, slot, getattr(self, slot))
+        return ret
+
+    # Heatflow1Deriv as read by the analyses; see RegionDeriv1
+    @property
+    def deriv1(self):
+        return RegionDeriv1(self)
+
+    # The whole of Heatflow1Deriv if it is computed already or the run is
+    # short, otherwise None
+    def full_deriv1(self):
+        if len(self.Tr) < LOCAL_DERIV_MIN_SAMPLES:
+            return self.Heatflow1Deriv
+        if not self.savgol_1_enabled:
+            return self.derivs.get(('raw', self.version))
+        stack = self.derivs.get(('savgol', self.version,
+            self.savgol_1_window))
+        if stack is None or 1 not in stack.rows:
+            return None
+        return stack.order(1)
+
+    # Heatflow1Deriv[start:stop], computed from the samples around it only
+    def deriv1_range(self, start, stop):
+        key = ('region', self.version, self.savgol_1_enabled,
+            self.savgol_1_window if self.savgol_1_enabled else None,
+            start, stop)
+        deriv = self.derivs.get(key)
+        if deriv is None:
+            deriv = self.compute_deriv1_range(start, stop)
+            deriv.flags.writeable = False
+            self.derivs.put(key, deriv)
+        return deriv
+
+    # Each segment overlapping the range is differentiated over the part
+    # of it in the range padded by the filter's half-width, which gives the
+    # same values there as differentiating the whole segment
+    def compute_deriv1_range(self, start, stop):
+        ret = np.full(stop - start, np.nan)
+        window = self.savgol_1_window if self.savgol_1_enabled else None
+        pad = (window // 2 if window else 0) + 1
+        for seg in self.get_segments():
+            a, b = max(start, seg.start), min(stop, seg.stop)
+            if a >= b or seg.stop - seg.start < 2:
+                continue
+            pa, pb = max(seg.start, a - pad), min(seg.stop, b + pad)
+            if window and savgol_applies(seg, window):
+                # The filter needs at least a window of samples
+                pa = max(seg.start, min(pa, pb - window))
+                pb = min(seg.stop, max(pb, pa + window))
+                delta = segment_time_step(self.t, seg)
+                deriv = ss.savgol_filter(self.Heatflow[pa:pb], window,
+                    SAVGOL_POLYORDER, deriv=1, delta=delta) / \
+                    ss.savgol_filter(self.Tr[pa:pb], window,
+                    SAVGOL_POLYORDER, deriv=1, delta=delta)
+            else:
+                deriv = gradient(self.Heatflow[pa:pb], self.Tr[pa:pb])
+            ret[a - start:b - start] = deriv[a - pa:b - pa]
+        return ret
+
+    def derivative_stack(self, window):
+        key = ('savgol', self.version, window)
+        stack = self.derivs.get(key)
+        if stack is None:
+            # Room for the derivatives of a few windows however long the run
+            self.derivs.max_bytes = max(DERIV_CACHE_BYTES,
+                DERIV_CACHE_SAMPLE_BYTES*len(self.Tr))
+            stack = DerivativeStack(self, window, key)
+            self.derivs.put(key, stack)
+        return stack
+
+    # Unsmoothed derivative. It is taken within each segment so that
+    # turnarounds do not leak into the ramps.
+    def compute_deriv1(self):
+        ret = np.full(len(self.Tr), np.nan)
+        for seg in self.get_segments():
+            if seg.stop - seg.start >= 2:
+                ret[seg.slice] = gradient(self.Heatflow[seg.slice], seg.tr)
+        return ret
 
     def __getitem__(self, index):
         return (self.Tr[index], self.Heatflow[index])
@@ -70,135 +685,347 @@ class DSCData:
         return self.np_Heatflow[l_region].mean() if l_mean > r_mean else \
             self.np_Heatflow[r_region].mean()
 
-    def peak_detect(self, x1, x2):
+    def peak_detect(self, x1, x2, segment=None):
+        if segment is None:
+            segment = self.segment_for(x1, x2)
+
         ### Find peak
         # The peak(s) is/are where the derivative is closest to zero
         # i.e. the absolute value of the derivative is minimum
-        sel_mask = self.get_tr_selection_mask(x1, x2)
+        sel = self.tr_selection(x1, x2, segment)
 
-        idx_in_sel = self.np_Index[sel_mask]
+        l_idx = selection_index(sel, np.argmin(self.Tr[sel]))
+        r_idx = selection_index(sel, np.argmax(self.Tr[sel]))
 
-        l_idx = idx_in_sel[np.argmin(self.np_Tr[sel_mask])]
-        r_idx = idx_in_sel[np.argmax(self.np_Tr[sel_mask])]
+        hf_idx = np.argmin(np.abs(self.deriv1[sel]))
 
-        hf_idx = np.argmin(np.abs(self.Heatflow1Deriv[sel_mask]))
-
-        peak_idx = idx_in_sel[hf_idx]
-        peak_tr = self.np_Tr[peak_idx]
+        peak_idx = selection_index(sel, hf_idx)
+        peak_tr = self.Tr[peak_idx]
 
         ### Find extrapolated onset/offset temperatures
         # ASTM E2253: Estimate local baseline based on region endpoints
-        baseline_slope = (self.np_Heatflow[l_idx] - self.np_Heatflow[r_idx]) /\
-            (self.np_Tr[l_idx] - self.np_Tr[r_idx])
+        baseline_slope = (self.Heatflow[l_idx] - self.Heatflow[r_idx]) /\
+            (self.Tr[l_idx] - self.Tr[r_idx])
         baseline_offset = self.offset_of(l_idx, baseline_slope)
 
         # Inflection occurs where the absolute value of the derivative is
         # maximum
-        l_region = (self.np_Tr < peak_tr) & (self.np_Tr > self.np_Tr[l_idx])
-        r_region = (self.np_Tr > peak_tr) & (self.np_Tr < self.np_Tr[r_idx])
-        if self.np_Index[l_region].size == 0:
+        l_region = self.tr_selection(self.Tr[l_idx], peak_tr, segment)
+        r_region = self.tr_selection(peak_tr, self.Tr[r_idx], segment)
+        if selection_size(l_region) == 0:
             l_extrap_idx = l_idx
         else:
-            l_extrap_idx = \
-                self.np_Index[l_region][
-                    np.argmax(np.abs(self.Heatflow1Deriv[l_region]))]
-        if self.np_Index[r_region].size == 0:
+            l_extrap_idx = selection_index(l_region,
+                np.argmax(np.abs(self.deriv1[l_region])))
+        if selection_size(r_region) == 0:
             r_extrap_idx = r_idx
         else:
-            r_extrap_idx = \
-                self.np_Index[r_region][
-                    np.argmax(np.abs(self.Heatflow1Deriv[r_region]))]
+            r_extrap_idx = selection_index(r_region,
+                np.argmax(np.abs(self.deriv1[r_region])))
 
-        ### TODO Find enthalpy based on trapezoidal integration
-        t_baseline_slope = (self.np_Heatflow[l_idx] - self.np_Heatflow[r_idx])\
-         / (self.np_t[l_idx] - self.np_t[r_idx])
-        t_baseline_offset = self.np_Heatflow[l_idx] - \
-            t_baseline_slope*self.np_t[l_idx]
+        ### Find enthalpy based on trapezoidal integration
+        t_baseline_slope = (self.Heatflow[l_idx] - self.Heatflow[r_idx])\
+         / (self.t[l_idx] - self.t[r_idx])
+        t_baseline_offset = self.Heatflow[l_idx] - \
+            t_baseline_slope*self.t[l_idx]
 
-        enthalp_t = self.np_t[sel_mask]
-        enthalp_base = enthalp_t * t_baseline_slope + t_baseline_offset
-        enthalp_intg = self.np_Heatflow[sel_mask] - enthalp_base
-        enthalp_area = np.trapz(enthalp_intg, enthalp_t)
+        if isinstance(sel, slice):
+            enthalp_area = self.region_area(sel.start, sel.stop - 1,
+                (t_baseline_slope, t_baseline_offset))
+        else:
+            enthalp_t = self.t[sel]
+            enthalp_base = enthalp_t * t_baseline_slope + t_baseline_offset
+            enthalp_intg = self.Heatflow[sel] - enthalp_base
+            enthalp_area = trapezoid(enthalp_intg, enthalp_t)
 
         return {
             'peak_idx': int(peak_idx),
             'onset_Tr_idx': int(self.baseline_intersection2(
-                l_extrap_idx, baseline_slope, baseline_offset)),
+                l_extrap_idx, baseline_slope, baseline_offset, segment)),
             'offset_Tr_idx': int(self.baseline_intersection2(
-                r_extrap_idx, baseline_slope, baseline_offset)),
+                r_extrap_idx, baseline_slope, baseline_offset, segment)),
             'enthalp_area': float(enthalp_area)
             }
 
     # Returns an index of a point closest to the x-coordinate of the
     # intersection of the 1st derivative of point specified by point_idx and a
     # baseline specified by baseline_height
-    def baseline_intersection(self, point_idx, baseline_height):
-        point_deriv = self.Heatflow1Deriv[point_idx]
+    def baseline_intersection(self, point_idx, baseline_height,
+            segment=None):
+        point_deriv = self.deriv1[point_idx]
         point_offset = self.offset_of(point_idx, point_deriv)
         onset_Tr = (baseline_height - point_offset) / point_deriv
-        return np.argmin(np.abs(self.np_Tr - onset_Tr))
+        return self.nearest_tr_idx(onset_Tr, segment)
 
     # Returns index of a point closest to the x-coordinate of the
     # intersection of the 1st derivative of point specified by point_idx and a
     # baseline specified by baseline_slope and baseline_offset
     def baseline_intersection2(self, point_idx,
-            baseline_slope, baseline_offset):
+            baseline_slope, baseline_offset, segment=None):
         point_deriv = self.deriv_of(point_idx)
         point_offset = self.offset_of(point_idx, point_deriv)
         onset_Tr = si_intersect(point_deriv, baseline_slope,
             point_offset, baseline_offset)[0]
-        return np.argmin(np.abs(self.np_Tr - onset_Tr))
+        return self.nearest_tr_idx(onset_Tr, segment)
 
     ### ASTM E1356
     # tg_index is index of maximum first derivative in region
-    def tg_detect1(self, x1, x2):
-        sel_mask = self.get_tr_selection_mask(x1, x2)
+    def tg_detect1(self, x1, x2, segment=None):
+        sel = self.tr_selection(x1, x2, segment)
 
         ### Find Tg
         # Point of maximum absolute first derivative (i.e. 'inflection
         # temperature')
-        tg_idx = self.np_Index[sel_mask][
-            np.argmax(np.abs(self.Heatflow1Deriv[sel_mask]))]
+        tg_idx = selection_index(sel,
+            np.argmax(np.abs(self.deriv1[sel])))
         return {'tig_idx': tg_idx}
 
     # tg_index
-    def tg_detect2(self, x1, x2):
-        sel_mask = self.get_tr_selection_mask(x1, x2)
-        idx_in_sel = self.np_Index[sel_mask]
-        l_idx = idx_in_sel[np.argmin(self.np_Tr[sel_mask])]
-        r_idx = idx_in_sel[np.argmax(self.np_Tr[sel_mask])]
+    def tg_detect2(self, x1, x2, segment=None):
+        if segment is None:
+            segment = self.segment_for(x1, x2)
+        sel = self.tr_selection(x1, x2, segment)
+        l_idx = selection_index(sel, np.argmin(self.Tr[sel]))
+        r_idx = selection_index(sel, np.argmax(self.Tr[sel]))
 
         # The tangents to the points at the boundary of the region are taken as
         # baselines.
-        l_deriv = self.Heatflow1Deriv[l_idx]
+        l_deriv = self.deriv1[l_idx]
         l_offset = self.offset_of(l_idx, l_deriv)
-        r_deriv = self.Heatflow1Deriv[r_idx]
+        r_deriv = self.deriv1[r_idx]
         r_offset = self.offset_of(r_idx, r_deriv)
 
         # Inflection (point of greatest slope)
-        tig_idx = self.tg_detect1(x1, x2)['tig_idx']
+        tig_idx = self.tg_detect1(x1, x2, segment)['tig_idx']
 
-        tig_deriv = self.Heatflow1Deriv[tig_idx]
+        tig_deriv = self.deriv1[tig_idx]
         tig_offset = self.offset_of(tig_idx, tig_deriv)
         
         # Extrapolated onset temperature
         tf_pt = si_intersect(l_deriv, tig_deriv, l_offset, tig_offset)
-        tf_idx = np.argmin(np.abs(self.np_Tr - tf_pt[0]))
+        tf_idx = self.nearest_tr_idx(tf_pt[0], segment)
 
         # Extrapolated end temperature
         te_pt = si_intersect(r_deriv, tig_deriv, r_offset, tig_offset)
-        te_idx = np.argmin(np.abs(self.np_Tr - te_pt[0]))
+        te_idx = self.nearest_tr_idx(te_pt[0], segment)
 
-        # Midpoint temperature
-        tm_idx = np.argmin(np.abs(self.np_Heatflow - np.mean(
-            [tf_pt[1],te_pt[1]])))
+        # Midpoint temperature, searched for between the extrapolated onset
+        # and end
+        tm_region = slice(min(tf_idx, te_idx), max(tf_idx, te_idx) + 1)
+        tm_idx = self.nearest_heatflow_idx(np.mean([tf_pt[1], te_pt[1]]),
+            tm_region)
 
         return {
             'tig_idx': int(tig_idx),
             'tf_idx': int(tf_idx),
             'tm_idx': int(tm_idx)
         }
+
+    #################### Batched analyses ####################
+    # peak_detect and tg_detect2 over an (N, 2) array of extents. Regions in
+    # monotonic segments are computed together, by reductions over their
+    # gathered samples; the rest fall back to one call each. segments gives
+    # each region's segment id (None to choose one, as for a single region).
+    # Returns a list of results, None for regions without samples.
+    def peak_detect_many(self, extents, segments=None):
+        return self.detect_many(self.peak_detect, self.peak_detect_slices,
+            extents, segments)
+
+    def tg_detect_many(self, extents, segments=None):
+        return self.detect_many(self.tg_detect2, self.tg_detect_slices,
+            extents, segments)
+
+    def detect_many(self, detect, detect_slices, extents, segments):
+        extents = np.asarray(extents, dtype=np.float64)
+        if extents.size == 0:
+            extents = extents.reshape(0, 2)
+        if extents.ndim != 2 or extents.shape[1] != 2:
+            raise Exception('Extents must be (lo, hi) pairs')
+        ret = [None]*len(extents)
+        if not self.get_segments():
+            return ret
+        lo, hi = extents.min(axis=1), extents.max(axis=1)
+        chosen = self.segments_for(lo, hi)
+        if segments is not None:
+            chosen = np.array([c if s is None else s
+                for c, s in zip(chosen, segments)])
+        for segment in np.unique(chosen):
+            which = np.flatnonzero(chosen == segment)
+            seg = self.get_segments()[segment]
+            if seg.direction == 0:
+                for i in which:
+                    try:
+                        ret[i] = detect(lo[i], hi[i], int(segment))
+                    except ValueError: # No samples
+                        pass
+                continue
+            starts, stops = seg.select_many(lo[which], hi[which])
+            found = stops > starts
+            if not found.any():
+                continue
+            starts, stops = starts[found], stops[found]
+            # The lowest Tr comes first on heating, the highest on cooling
+            last = seg.start + seg.first_position(
+                seg.sorted_index(stops - 1 - seg.start))
+            if seg.direction == 1:
+                l_idx, r_idx = starts, last
+            else:
+                l_idx, r_idx = last, starts
+            # Batches of regions small enough for their gathered samples to
+            # stay in cache
+            lengths = stops - starts
+            batch = (np.cumsum(lengths) - lengths) // MANY_BATCH_SAMPLES
+            cuts = np.r_[0, np.flatnonzero(np.diff(batch)) + 1, len(batch)]
+            which = which[found]
+            for a, b in zip(cuts[:-1], cuts[1:]):
+                for i, result in zip(which[a:b], detect_slices(seg,
+                        starts[a:b], stops[a:b], l_idx[a:b], r_idx[a:b])):
+                    ret[i] = result
+        return ret
+
+    # Position of the maximum absolute derivative between Tr values a and b
+    # (exclusive) of each region, or default where there are no samples
+    def max_abs_deriv_many(self, seg, a, b, default):
+        starts, stops = seg.select_many(np.minimum(a, b), np.maximum(a, b))
+        ret = np.array(default)
+        found = stops > starts
+        if found.any():
+            idx, offsets = gather(starts[found], stops[found])
+            ret[found] = segment_argmin(-np.abs(self.deriv1[idx]),
+                idx, offsets)
+        return ret
+
+    def peak_detect_slices(self, seg, starts, stops, l_idx, r_idx):
+        idx, offsets = gather(starts, stops)
+        peak_idx = segment_argmin(np.abs(self.deriv1[idx]), idx,
+            offsets)
+        peak_tr = self.Tr[peak_idx]
+
+        baseline_slope = (self.Heatflow[l_idx] - self.Heatflow[r_idx]) /\
+            (self.Tr[l_idx] - self.Tr[r_idx])
+        baseline_offset = self.offset_of(l_idx, baseline_slope)
+        l_extrap_idx = self.max_abs_deriv_many(seg, self.Tr[l_idx], peak_tr,
+            l_idx)
+        r_extrap_idx = self.max_abs_deriv_many(seg, peak_tr, self.Tr[r_idx],
+            r_idx)
+
+        t_baseline_slope = (self.Heatflow[l_idx] - self.Heatflow[r_idx])\
+         / (self.t[l_idx] - self.t[r_idx])
+        t_baseline_offset = self.Heatflow[l_idx] - \
+            t_baseline_slope*self.t[l_idx]
+        enthalp_area = self.region_area(starts, stops - 1,
+            (t_baseline_slope, t_baseline_offset))
+
+        onset_idx = self.baseline_intersection_many(seg, l_extrap_idx,
+            baseline_slope, baseline_offset)
+        offset_idx = self.baseline_intersection_many(seg, r_extrap_idx,
+            baseline_slope, baseline_offset)
+        return [{
+            'peak_idx': int(peak_idx[i]),
+            'onset_Tr_idx': int(onset_idx[i]),
+            'offset_Tr_idx': int(offset_idx[i]),
+            'enthalp_area': float(enthalp_area[i])
+            } for i in range(len(starts))]
+
+    def baseline_intersection_many(self, seg, point_idx, baseline_slope,
+            baseline_offset):
+        point_deriv = self.deriv_of(point_idx)
+        point_offset = self.offset_of(point_idx, point_deriv)
+        onset_Tr = si_intersect(point_deriv, baseline_slope,
+            point_offset, baseline_offset)[0]
+        return seg.start + seg.nearest_many(onset_Tr)
+
+    def tg_detect_slices(self, seg, starts, stops, l_idx, r_idx):
+        l_deriv = self.deriv1[l_idx]
+        l_offset = self.offset_of(l_idx, l_deriv)
+        r_deriv = self.deriv1[r_idx]
+        r_offset = self.offset_of(r_idx, r_deriv)
+
+        idx, offsets = gather(starts, stops)
+        tig_idx = segment_argmin(-np.abs(self.deriv1[idx]), idx,
+            offsets)
+        tig_deriv = self.deriv1[tig_idx]
+        tig_offset = self.offset_of(tig_idx, tig_deriv)
+
+        tf_pt = si_intersect(l_deriv, tig_deriv, l_offset, tig_offset)
+        tf_idx = seg.start + seg.nearest_many(tf_pt[0])
+        te_pt = si_intersect(r_deriv, tig_deriv, r_offset, tig_offset)
+        te_idx = seg.start + seg.nearest_many(te_pt[0])
+
+        tm_starts = np.minimum(tf_idx, te_idx)
+        tm_stops = np.maximum(tf_idx, te_idx) + 1
+        idx, offsets = gather(tm_starts, tm_stops)
+        tm_hf = np.repeat(np.mean([tf_pt[1], te_pt[1]], axis=0),
+            tm_stops - tm_starts)
+        tm_idx = segment_argmin(np.abs(self.Heatflow[idx] - tm_hf), idx,
+            offsets)
+        return [{
+            'tig_idx': int(tig_idx[i]),
+            'tf_idx': int(tf_idx[i]),
+            'tm_idx': int(tm_idx[i])
+        } for i in range(len(starts))]
         
+#################### Analysis results ####################
+TG_VALUES = ('tig_Tr', 'tig_Heatflow', 'tf_Tr', 'tf_Heatflow', 'tm_Tr',
+    'tm_Heatflow')
+PEAK_VALUES = ('peak_Tr', 'peak_Heatflow', 'onset_Tr', 'onset_Heatflow',
+    'offset_Tr', 'offset_Heatflow', 'enthalp_area')
+# Points of each mode's result as (name in values, index key in the result)
+ANALYSIS_POINTS = {
+    'tg': (('tig', 'tig_idx'), ('tf', 'tf_idx'), ('tm', 'tm_idx')),
+    'peak': (('peak', 'peak_idx'), ('onset', 'onset_Tr_idx'),
+        ('offset', 'offset_Tr_idx'))}
+
+# Performs an analysis of the given mode ('tg' or 'peak') over the Tr
+# extents of a segment (by default chosen by DSCData.segment_for), returning
+# it in the dict shape stored by DSCAnalysis
+def run_analysis(data, mode, extents, name=None, segment=None):
+    if segment is None:
+        segment = data.segment_for(extents[0], extents[1])
+    if mode == 'tg':
+        result = data.tg_detect2(extents[0], extents[1], segment)
+    elif mode == 'peak':
+        result = data.peak_detect(extents[0], extents[1], segment)
+    else:
+        raise Exception('Invalid mode')
+    return make_analysis(mode, extents, segment, result, name)
+
+ANALYSIS_NAMES = {'tg': 'Glass Transition Analysis', 'peak': 'Peak Analysis'}
+
+# The analysis dict stored by DSCAnalysis for a result of tg_detect2 or
+# peak_detect
+def make_analysis(mode, extents, segment, result, name=None):
+    return {'name': name or ANALYSIS_NAMES[mode], 'mode': mode,
+        'extents': [float(x) for x in extents], 'segment': int(segment),
+        mode: result}
+
+# Flattens an analysis into the temperatures/heatflows of its points
+def analysis_values(data, ana):
+    ret = {}
+    result = ana[ana['mode']]
+    for point, key in ANALYSIS_POINTS[ana['mode']]:
+        ret[point+'_Tr'], ret[point+'_Heatflow'] = data[result[key]]
+    if ana['mode'] == 'peak':
+        ret['enthalp_area'] = result['enthalp_area']
+    return {k: float(v) for k, v in ret.items()}
+
+# Values of results from one mode's *_detect_many as arrays keyed like
+# analysis_values, NaN for regions without a result
+def analysis_values_many(data, mode, results):
+    found = np.array([r is not None for r in results], dtype=bool)
+    ret = {}
+    for point, key in ANALYSIS_POINTS[mode]:
+        idx = np.array([r[key] for r in results if r is not None],
+            dtype=np.int64)
+        for col in ('Tr', 'Heatflow'):
+            values = np.full(len(results), np.nan)
+            values[found] = getattr(data, col)[idx]
+            ret[point+'_'+col] = values
+    if mode == 'peak':
+        ret['enthalp_area'] = np.array([np.nan if r is None else
+            r['enthalp_area'] for r in results])
+    return ret
+
 #################### Text parsing ####################
 RE_LINE = re.compile(
     '(\d+)\s+' # int
@@ -206,16 +1033,345 @@ RE_LINE = re.compile(
     '(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)\s+' # float
     '(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)') # float
 
+# Powers of ten that are exactly representable as float64; scaling an exact
+# integer mantissa by one of these rounds once, exactly like float(str)
+EXACT_POW10 = np.array([float('1e%d' % k) for k in range(23)])
+# Rows converted at a time by the fixed-width parser; keeps the working set
+# of the column-wise passes in cache
+FIXED_WIDTH_BLOCK_ROWS = 1 << 15
+
+# Characters read at a time by the streaming reader
+READ_CHUNK_SIZE = 1 << 22
+
 def parse_tabulated_txt(text):
+    rows = parse_rows(text)
+    if rows is None:
+        raise Exception('No rows parsed; possibly wrong file type')
+    ret = DSCData()
+    ret.Index, ret.t, ret.Heatflow, ret.Tr = rows[:4]
+    ret.notes = filter_control(text[rows[4]:])
+    return ret
+
+def parse_tabulated_txt_regex(text):
+    rows = parse_rows_regex(text)
+    if rows is None:
+        raise Exception('No rows parsed; possibly wrong file type')
     ret = DSCData()
+    ret.Index, ret.t, ret.Heatflow, ret.Tr = rows[:4]
+    ret.notes = filter_control(text[rows[4]:])
+    return ret
+
+# Returns (Index, t, Heatflow, Tr, notes_start) for the rows in text, where
+# notes_start is the position following the last row, or None if there are
+# no rows. The data block is located once and converted columnwise; odd
+# files fall back to the per-row regex parser.
+def parse_rows(text):
+    block = locate_data_block(text)
+    if block is None:
+        return None
+    start, end, notes_start = block
+    cols = parse_data_block(text, start, end + 1)
+    if cols is None:
+        return parse_rows_regex(text)
+    return cols + (notes_start,)
+
+def parse_rows_regex(text):
+    Index, t, Heatflow, Tr = [], [], [], []
     stored_m = None
     for m in re.finditer(RE_LINE, text):
-        ret.Index.append(int(m.group(1)))
-        ret.t.append(float(m.group(2)))
-        ret.Heatflow.append(float(m.group(3)))
-        ret.Tr.append(float(m.group(4)))
+        Index.append(int(m.group(1)))
+        t.append(float(m.group(2)))
+        Heatflow.append(float(m.group(3)))
+        Tr.append(float(m.group(4)))
         stored_m = m
-    if not len(ret.Index):
+    if not len(Index):
+        return None
+    return (np.array(Index, dtype=np.int64), np.array(t, dtype=np.float64),
+        np.array(Heatflow, dtype=np.float64), np.array(Tr, dtype=np.float64),
+        stored_m.end())
+
+# Yields DSCData blocks holding the rows of successive chunks of the text
+# file f, so that files larger than memory can be processed. Rows split
+# across chunks are carried over to the next chunk. The notes of the file
+# (text following the last row) are attached to the last block.
+def iter_tabulated_txt(f, chunk_size=READ_CHUNK_SIZE):
+    carry = ''
+    notes = ''
+    held = None
+    while True:
+        chunk = f.read(chunk_size)
+        text = carry + chunk
+        if chunk:
+            # Only parse complete lines
+            cut = text.rfind('\n') + 1
+            text, carry = text[:cut], text[cut:]
+        if text:
+            rows = parse_rows(text)
+            if rows is None:
+                notes += text
+            else:
+                if held is not None:
+                    yield held
+                held = DSCData()
+                held.Index, held.t, held.Heatflow, held.Tr = rows[:4]
+                notes = text[rows[4]:]
+        if not chunk:
+            break
+    if held is None:
         raise Exception('No rows parsed; possibly wrong file type')
-    ret.notes = filter_control(text[stored_m.end():])
+    held.notes = filter_control(notes)
+    yield held
+
+# Reads the text file f in chunks into arrays that grow as rows arrive.
+# progress, if given, is called with the number of rows read after each chunk.
+def read_tabulated_txt(f, chunk_size=READ_CHUNK_SIZE, progress=None):
+    ret = DSCData()
+    cols = None
+    size = 0
+    for block in iter_tabulated_txt(f, chunk_size):
+        new = (block.Index, block.t, block.Heatflow, block.Tr)
+        if cols is None:
+            cols = [np.array(col) for col in new]
+        elif size + len(block.Index) > len(cols[0]):
+            capacity = max(2*len(cols[0]), size + len(block.Index))
+            for col in cols:
+                col.resize(capacity, refcheck=False)
+        if size:
+            for col, new_col in zip(cols, new):
+                col[size:size + len(new_col)] = new_col
+        size += len(block.Index)
+        ret.notes = block.notes
+        if progress is not None:
+            progress(size)
+    for col in cols:
+        col.resize(size, refcheck=False)
+    ret.Index, ret.t, ret.Heatflow, ret.Tr = cols
+    return ret
+
+# Returns (start, end, notes_start) of the block of rows: start is the
+# beginning of the line holding the first row, end is the end (the newline,
+# if any) of the line holding the last row and notes_start is where the last
+# row match ends.
+# Returns None if no rows are found.
+def locate_data_block(text):
+    first = RE_LINE.search(text)
+    if first is None:
+        return None
+    start = text.rfind('\n', 0, first.start()) + 1
+
+    # Walk back over trailing (notes) lines to the last row
+    end = len(text)
+    while True:
+        line_start = max(text.rfind('\n', start, end) + 1, start)
+        last = RE_LINE.search(text, line_start, end)
+        if last is not None:
+            return start, end, last.end()
+        end = line_start - 1
+
+# Converts a block consisting only of newline-terminated rows to
+# (Index, t, Heatflow, Tr) arrays, or returns None if the block does not have
+# that shape. The block is text[start:stop].
+def parse_data_block(text, start, stop):
+    # Latin-1 keeps one byte per character, so positions in text are those
+    # in raw; characters it cannot encode become '?', which no field accepts
+    raw = text.encode('latin-1', 'replace')
+    cols = parse_fixed_width_block(raw, start, stop)
+    if cols is None:
+        block = text[start:stop]
+        if not block.isascii():
+            return None
+        # Rows are not column-aligned: let numpy tokenize the block
+        nrows = block.count('\n') + (not block.endswith('\n'))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                flat = np.fromstring(block, dtype=np.float64, sep=' ')
+            except (ValueError, DeprecationWarning):
+                return None
+        if flat.size != 4*nrows:
+            return None
+        cols = flat.reshape(nrows, 4).T
+    Index = cols[0].astype(np.int64)
+    if not np.array_equal(Index, cols[0]):
+        return None
+    return (Index, np.ascontiguousarray(cols[1]),
+        np.ascontiguousarray(cols[2]), np.ascontiguousarray(cols[3]))
+
+# STARe writes right-aligned columns of constant width. For such blocks each
+# field is a fixed set of byte columns, so the digits of every field can be
+# weighted and summed in one product of the block's digit values with a
+# matrix of weights, without tokenizing rows at all. The block is
+# raw[start:stop], read in place.
+def parse_fixed_width_block(raw, start=0, stop=None):
+    if stop is None:
+        stop = len(raw)
+    if stop <= start:
+        return None
+    chars = np.frombuffer(raw, dtype=np.uint8, count=stop - start,
+        offset=start)
+    if chars[-1] != ord('\n'):
+        chars = np.append(chars, np.uint8(ord('\n')))
+    width = raw.find(b'\n', start, stop) + 1 - start
+    if width <= 0:
+        width = len(chars)
+    if len(chars) % width:
+        return None
+    nrows = len(chars) // width
+    chars = chars.reshape(nrows, width)
+    col_min, col_max = column_extremes(chars)
+    if col_min[-1] != ord('\n') or col_max[-1] != ord('\n'):
+        return None
+    end = width - 1
+    if end and col_min[end - 1] == col_max[end - 1] == ord('\r'):
+        end -= 1
+    chars, col_min, col_max = chars[:, :end], col_min[:end], col_max[:end]
+    if col_max.max(initial=0) >= 0x80:
+        return None
+
+    # Fields are runs of byte columns that are not blank in every row
+    blank = (col_min == ord(' ')) & (col_max == ord(' '))
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], blank, [1]))))
+    if len(edges) != 8:
+        return None
+    # Only the span of the fields takes part in the product
+    span = slice(edges[0], edges[-1])
+    chars, col_min, col_max = chars[:, span], col_min[span], col_max[span]
+    edges = edges - edges[0]
+    fields = [fixed_width_field(start, stop, col_min, col_max)
+        for start, stop in zip(edges[::2], edges[1::2])]
+    if any(field is None for field in fields):
+        return None
+    # Mantissa and exponent weights of each field, as columns. Sums of up to
+    # 7 digits are exact in float32, which halves the work of the product.
+    dtype = np.float32 if all(field.digits <= 7 for field in fields) \
+        else np.float64
+    weights = np.column_stack([w for field in fields
+        for w in (field.weights, field.exp_weights)]).astype(dtype)
+
+    cols = np.empty((4, nrows), dtype=np.float64)
+    for row in range(0, nrows, FIXED_WIDTH_BLOCK_ROWS):
+        rows = slice(row, row + FIXED_WIDTH_BLOCK_ROWS)
+        block = chars[rows]
+        digits = block - np.uint8(ord('0'))
+        isdigit = digits < 10
+        digits *= isdigit
+        sums = digits.astype(dtype) @ weights
+        for k, field in enumerate(fields):
+            if not fixed_width_values(field, block, isdigit,
+                    sums[:, 2*k], sums[:, 2*k + 1], cols[k, rows]):
+                return None
+    return cols
+
+# Smallest and largest byte of each column of the rows of chars, which must
+# be contiguous. Reducing a few rows at a time along the row axis is slow,
+# so groups of rows are first reduced as one wide row.
+def column_extremes(chars, group=256):
+    nrows, width = chars.shape
+    n = nrows - nrows % group
+    wide = chars[:n].reshape(-1, group*width)
+    col_min = wide.min(axis=0, initial=255).reshape(group, width).min(axis=0)
+    col_max = wide.max(axis=0, initial=0).reshape(group, width).max(axis=0)
+    if n < nrows:
+        col_min = np.minimum(col_min, chars[n:].min(axis=0))
+        col_max = np.maximum(col_max, chars[n:].max(axis=0))
+    return col_min, col_max
+
+# Layout of a right-aligned number in byte columns start:stop of each row,
+# where col_min/col_max are the byte extremes of each column over the whole
+# block. weights and exp_weights weight the digits of the mantissa and of the
+# exponent over the whole row and digits is the most of either; sign_col is
+# the column of the exponent's sign, if it has one; lead are the mantissa's
+# columns mixing blanks, a minus sign and digits and lead_next the digit
+# columns following each, as slices where they are runs. The decimal point
+# and exponent marker must sit in the same byte column in every row,
+# otherwise None is returned. Mantissas have at most 15 digits, so their
+# sums are exact.
+class FixedWidthField:
+    __slots__ = ('weights', 'exp_weights', 'digits', 'sign_col',
+        'frac_digits', 'lead', 'lead_next')
+
+def fixed_width_field(start, stop, col_min, col_max):
+    ret = FixedWidthField()
+    ret.weights = np.zeros(len(col_min))
+    ret.exp_weights = np.zeros(len(col_min))
+    ret.sign_col = None
+    width = stop - start
+    col_min, col_max = col_min[start:stop], col_max[start:stop]
+    constant = col_min == col_max
+    all_digits = (col_min >= ord('0')) & (col_max <= ord('9'))
+    exp_cols = np.flatnonzero(constant &
+        ((col_min == ord('e')) | (col_min == ord('E'))))
+    if len(exp_cols) > 1:
+        return None
+    exp_col = exp_cols[0] if len(exp_cols) else width
+
+    if exp_col < width:
+        first = exp_col + 1
+        if first < width and not all_digits[first]:
+            ret.sign_col = start + first
+            first += 1
+        if first == width or not np.all(all_digits[first:]):
+            return None
+        ret.exp_weights[start + first:stop] = \
+            EXACT_POW10[width - first - 1::-1]
+
+    ret.frac_digits = 0
+    dot_cols = np.flatnonzero(constant[:exp_col] &
+        (col_min[:exp_col] == ord('.')))
+    if len(dot_cols) > 1:
+        return None
+    digit_cols = np.arange(exp_col)
+    if len(dot_cols):
+        ret.frac_digits = exp_col - dot_cols[0] - 1
+        digit_cols = np.delete(digit_cols, dot_cols[0])
+    if not len(digit_cols) or len(digit_cols) > 15 or \
+            not all_digits[digit_cols[-1]]:
+        return None
+    ret.weights[start + digit_cols] = EXACT_POW10[len(digit_cols) - 1::-1]
+    ret.digits = max(len(digit_cols), width - exp_col)
+    mixed = np.flatnonzero(~all_digits[digit_cols])
+    ret.lead = as_run(start + digit_cols[mixed])
+    ret.lead_next = as_run(start + digit_cols[mixed + 1])
     return ret
+
+# Consecutive positions as a slice, for indexing with a view
+def as_run(positions):
+    if len(positions) and np.all(np.diff(positions) == 1):
+        return slice(positions[0], positions[-1] + 1)
+    return positions
+
+# Writes the values of a field in the rows of block to out, given where the
+# block holds digits and the sums of the field's mantissa and exponent
+# digits. Returns False if a row does not fit the field's layout.
+def fixed_width_values(field, block, isdigit, value, exponent, out):
+    # Leading columns may mix blanks, a minus sign and digits; digits must
+    # be right-aligned and a minus sign must directly precede them
+    negative = None
+    if not isinstance(field.lead, np.ndarray) or len(field.lead):
+        lead = block[:, field.lead]
+        blank = lead == ord(' ')
+        minus = lead == ord('-')
+        if not np.all(blank | minus | isdigit[:, field.lead]) or \
+                not np.all(blank | isdigit[:, field.lead_next]):
+            return False
+        if minus.any():
+            negative = minus.any(axis=1)
+
+    scale = exponent.astype(np.int64)
+    if field.sign_col is not None:
+        sign = block[:, field.sign_col]
+        minus_exp = sign == ord('-')
+        if not np.all(minus_exp | (sign == ord('+'))):
+            return False
+        np.negative(scale, out=scale, where=minus_exp)
+    scale -= field.frac_digits
+    down = scale < 0
+    np.abs(scale, out=scale)
+    if scale.max(initial=0) >= len(EXACT_POW10):
+        return False
+    pow10 = EXACT_POW10[scale]
+    np.divide(value, pow10, out=out, where=down)
+    np.multiply(value, pow10, out=out, where=~down)
+    if negative is not None:
+        np.negative(out, out=out, where=negative)
+    return True
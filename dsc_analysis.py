@@ -1,5 +1,10 @@
 from PySide6.QtCore import (Slot, Signal, Qt, QObject, QCoreApplication)
 from dsc import DSCData
+from util import LRUCache
+
+# Analysis results kept for reuse, e.g. when smoothing is switched back
+ANALYSIS_CACHE_ENTRIES = 4096
+
 class DSCAnalysis(QObject):
     update_current_analysis = Signal(dict)
     add_analysis_display = Signal(dict)
@@ -17,18 +22,70 @@ class DSCAnalysis(QObject):
         self.tg_analyses_num = 1
         self.peak_analyses_num = 1
 
+        # Edits since the analyses were last saved, as project journal
+        # records (see dsc_serialize.apply_journal)
+        self.journal = []
+        # Records written by the last update_all_analyses, rewritten by the
+        # next while they are still the end of the journal and unsaved
+        self.reperformed = []
+
+        # Results of tg_detect2/peak_detect keyed by analysis_key
+        self.results = LRUCache(ANALYSIS_CACHE_ENTRIES)
+
+    # Everything a result depends on: the data (by version), the region and
+    # the smoothing of the derivative
+    def analysis_key(self, data : DSCData, ana : dict):
+        return (data.version, ana['mode'], tuple(ana['extents']),
+            ana.get('segment'), data.savgol_1_enabled,
+            data.savgol_1_window if data.savgol_1_enabled else None)
+
     def update_all_analyses(self, data : DSCData):
         if len(self.analyses) == 0:
             return
-        for ana in self.analyses:
-            if ana.mode == 'tg':
-                ana['tg'] = data.tg_detect2(ana['extents'][0],
-                    ana['extents'][1])
-            elif ana.mode == 'peak':
-                ana['peak'] = data.peak_detect(ana['extents'][0],
-                    ana['extents'][1])
+        changed = []
+        for mode, detect_many in (('tg', data.tg_detect_many),
+                ('peak', data.peak_detect_many)):
+            which = [i for i, ana in enumerate(self.analyses)
+                if ana['mode'] == mode]
+            anas = [self.analyses[i] for i in which]
+            keys = [self.analysis_key(data, ana) for ana in anas]
+            results = [self.results.get(key) for key in keys]
+            # Only analyses whose inputs changed are recomputed
+            stale = [i for i, result in enumerate(results) if result is None]
+            if stale:
+                # Selector extents also hold the y range
+                fresh = detect_many([anas[i]['extents'][:2] for i in stale],
+                    [anas[i].get('segment') for i in stale])
+                for i, result in zip(stale, fresh):
+                    if result is None:
+                        raise Exception('No data in region of ' +
+                            anas[i]['name'])
+                    self.results.put(keys[i], result)
+                    results[i] = result
+            for i, ana, result in zip(which, anas, results):
+                if ana.get(mode) != result:
+                    ana[mode] = dict(result)
+                    changed.append(i)
+        # Only the analyses whose results changed are journaled, so that
+        # smoothing changes add at most one record per analysis
+        ops = {}
+        n = len(self.reperformed)
+        if n and len(self.journal) >= n and all(a is b
+                for a, b in zip(self.journal[-n:], self.reperformed)):
+            ops = {op['index']: op for op in self.reperformed}
+            del self.journal[-n:]
+        for i in changed:
+            ops[i] = {'op': 'set', 'index': i,
+                'analysis': dict(self.analyses[i])}
+        self.reperformed = [ops[i] for i in sorted(ops)]
+        self.journal += self.reperformed
         self.update_current_analysis.emit(self.current_analysis)
 
+    # Called when the journal is taken for saving; the records taken are no
+    # longer rewritten
+    def seal_journal(self):
+        self.reperformed = []
+
     def get_analysis_num(self, mode):
         ret = 0
         if mode == 'tg':
@@ -46,11 +103,14 @@ class DSCAnalysis(QObject):
         if self.current_analysis is None:
             return
         self.current_analysis['name'] = name
+        self.journal.append({'op': 'rename',
+            'index': self.current_analysis_index, 'name': name})
         self.send_change_analysis_name.emit(
             self.current_analysis_index, name)
 
     def add_analysis(self, ana : dict):
         self.analyses.append(ana)
+        self.journal.append({'op': 'add', 'analysis': dict(ana)})
 
         self.current_analysis = self.analyses[-1]
         self.current_analysis_index = len(self.analyses) - 1
@@ -60,6 +120,8 @@ class DSCAnalysis(QObject):
 
     def load_analysis(self, ana : list):
         self.analyses = ana
+        self.journal = []
+        self.reperformed = []
         if len(ana) > 0:
             self.current_analysis = self.analyses[0]
             self.current_analysis_index = 0
@@ -73,6 +135,8 @@ class DSCAnalysis(QObject):
             return
 
         del self.analyses[self.current_analysis_index]
+        self.journal.append({'op': 'del',
+            'index': self.current_analysis_index})
         self.del_analysis_display.emit(self.current_analysis_index)
 
         if not len(self.analyses):
@@ -117,5 +181,7 @@ class DSCAnalysis(QObject):
             preserve_name = self.current_analysis["name"]
             self.analyses[self.current_analysis_index] = ana
             self.analyses[self.current_analysis_index]["name"] = preserve_name
+            self.journal.append({'op': 'set',
+                'index': self.current_analysis_index, 'analysis': dict(ana)})
             self.current_analysis = self.analyses[self.current_analysis_index]
             self.update_current_analysis.emit(self.current_analysis)
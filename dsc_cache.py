@@ -0,0 +1,170 @@
+# On-disk cache of parsed tabulated text files. Columns are stored as .npy
+# files under a directory named after the content hash of the source file and
+# are memory-mapped when read back, so reopening a file skips decoding and
+# parsing and the pages are shared between processes.
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from dsc import DSCData, COLUMNS
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pydsc')
+CACHE_MAX_BYTES = 1 << 30
+HASH_BLOCK_SIZE = 1 << 20
+INDEX_FILE = 'index.json'
+META_FILE = 'meta.json'
+
+# progress, if given, is called with the number of bytes hashed after each
+# block
+def file_hash(path, progress=None):
+    h = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+            size += len(block)
+            if progress is not None:
+                progress(size)
+    return h.hexdigest()
+
+class DSCCache:
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.environ.get('PYDSC_CACHE_DIR', CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # (path, size, mtime_ns, digest) of the last file hashed by load(), so
+        # that a following store() need not hash it again
+        self.last_hash = None
+
+    def entry_dir(self, digest):
+        return os.path.join(self.cache_dir, digest)
+
+    # Maps absolute source paths to the size, mtime and hash they had when
+    # last seen
+    def read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = os.path.join(self.cache_dir,
+            INDEX_FILE + '.%d.tmp' % os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.cache_dir, INDEX_FILE))
+
+    # Returns the content hash of the file at path. The file is only rehashed
+    # (see file_hash for progress) if its size or mtime differ from what the
+    # index recorded.
+    def source_hash(self, path, index, progress=None):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = index.get(path)
+        if entry is not None and entry['size'] == st.st_size and \
+                entry['mtime_ns'] == st.st_mtime_ns:
+            digest = entry['hash']
+        else:
+            digest = file_hash(path, progress)
+        self.last_hash = (path, st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    # Records the file's current size/mtime/hash in the index. An entry that
+    # the path pointed to before is dropped if nothing else refers to it.
+    def update_index(self, index):
+        path, size, mtime_ns, digest = self.last_hash
+        old = index.get(path)
+        index[path] = {'size': size, 'mtime_ns': mtime_ns, 'hash': digest}
+        if old is not None and old['hash'] != digest and \
+                not any(e['hash'] == old['hash'] for e in index.values()):
+            shutil.rmtree(self.entry_dir(old['hash']), ignore_errors=True)
+        self.write_index(index)
+
+    # Returns a DSCData with memory-mapped columns if the file is cached,
+    # otherwise None
+    def load(self, path, progress=None):
+        index = self.read_index()
+        digest = self.source_hash(path, index, progress)
+        entry = self.entry_dir(digest)
+        try:
+            with open(os.path.join(entry, META_FILE)) as f:
+                meta = json.load(f)
+            cols = [np.load(os.path.join(entry, col + '.npy'), mmap_mode='r')
+                for col in COLUMNS]
+        except (OSError, ValueError):
+            return None
+        # The meta file's mtime is the entry's last use for eviction
+        os.utime(os.path.join(entry, META_FILE))
+        if index.get(self.last_hash[0], {}).get('mtime_ns') != \
+                self.last_hash[2]:
+            self.update_index(index)
+
+        ret = DSCData()
+        ret.Index, ret.t, ret.Heatflow, ret.Tr = cols
+        ret.notes = meta['notes']
+        return ret
+
+    def store(self, path, data, progress=None):
+        index = self.read_index()
+        abspath = os.path.abspath(path)
+        st = os.stat(abspath)
+        if self.last_hash is None or \
+                self.last_hash[:3] != (abspath, st.st_size, st.st_mtime_ns):
+            self.source_hash(abspath, index, progress)
+        entry = self.entry_dir(self.last_hash[3])
+
+        if not os.path.exists(entry):
+            # Write into a private directory and rename it into place so
+            # other processes never see a partial entry
+            tmp = entry + '.%d.tmp' % os.getpid()
+            os.makedirs(tmp, exist_ok=True)
+            for col in COLUMNS:
+                np.save(os.path.join(tmp, col + '.npy'),
+                    np.ascontiguousarray(getattr(data, col)))
+            with open(os.path.join(tmp, META_FILE), 'w') as f:
+                json.dump({'notes': data.notes, 'source': abspath}, f)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # Another process stored the same file first
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.update_index(index)
+        self.evict(keep=self.last_hash[3])
+
+    # Removes least recently used entries until the cache fits in max_bytes
+    def evict(self, keep=None):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            entry = self.entry_dir(name)
+            meta = os.path.join(entry, META_FILE)
+            if not os.path.isfile(meta):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f))
+                for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta), size, name))
+            total += size
+        entries.sort()
+        removed = set()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self.entry_dir(name), ignore_errors=True)
+            removed.add(name)
+            total -= size
+        if removed:
+            index = self.read_index()
+            self.write_index({path: e for path, e in index.items()
+                if e['hash'] not in removed})
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dsc
+import dsc_events
+from util import open_text, expand_inputs
+
+RESULT_FIELDS = ('file', 'name', 'mode', 'x1', 'x2', 'segment') + \
+    dsc.TG_VALUES + dsc.PEAK_VALUES + ('error',)
+
+# Batch spec: smoothing settings and the regions to analyse in every file,
+# in the same shape as the analyses stored by DSCAnalysis (a region may name
+# its segment of the run; by default dsc.DSCData.segment_for picks one), e.g.
+# {"smoothing": {"enabled": true, "window": 7},
+#  "analyses": [{"name": "Tg", "mode": "tg", "extents": [60, 95]},
+#               {"name": "Melt", "mode": "peak", "extents": [225, 262]}]}
+# With "auto": true, the regions found by dsc_events are analysed as well.
+def load_spec(fi):
+    with open(fi) as f:
+        return json.load(f)
+
+def parse_region(s):
+    try:
+        lo, hi = (float(x) for x in s.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected LO:HI, got '+s)
+    return [lo, hi]
+
+# Analyses one file; errors are reported in the rows rather than raised so
+# that one bad file or region does not stop the batch
+def analyze_file(path, spec):
+    try:
+        with open_text(path) as f:
+            data = dsc.read_tabulated_txt(f)
+        smoothing = spec.get('smoothing', {})
+        data.savgol_1_enabled = smoothing.get('enabled', False)
+        data.savgol_1_window = smoothing.get('window', data.savgol_1_window)
+        data.prepare_extra()
+    except Exception as e:
+        return [{'file': path, 'error': str(e)}]
+
+    rows = []
+    for region in spec.get('analyses', []):
+        extents = region['extents']
+        row = {'file': path, 'name': region.get('name', ''),
+            'mode': region['mode'], 'x1': extents[0], 'x2': extents[1]}
+        try:
+            ana = dsc.run_analysis(data, region['mode'], extents,
+                segment=region.get('segment'))
+            row['segment'] = ana['segment']
+            row.update(dsc.analysis_values(data, ana))
+        except Exception as e:
+            row['error'] = str(e)
+        rows.append(row)
+    if spec.get('auto'):
+        try:
+            events = dsc_events.find_events(data)
+        except Exception as e:
+            rows.append({'file': path, 'name': 'auto', 'error': str(e)})
+        else:
+            for ana in events:
+                row = {'file': path, 'name': ana['name'], 'mode': ana['mode'],
+                    'x1': ana['extents'][0], 'x2': ana['extents'][1],
+                    'segment': ana['segment']}
+                row.update(dsc.analysis_values(data, ana))
+                rows.append(row)
+    return rows
+
+# Analyses all files over a process pool, returning rows in input order.
+# progress is called with (number done, total, path, rows) as files finish.
+def analyze_files(paths, spec, jobs=None, progress=None):
+    results = {}
+    if jobs == 1:
+        for path in paths:
+            results[path] = analyze_file(path, spec)
+            if progress:
+                progress(len(results), len(paths), path, results[path])
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = {executor.submit(analyze_file, path, spec): path
+                for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except Exception as e: # e.g. worker died
+                    results[path] = [{'file': path, 'error': str(e)}]
+                if progress:
+                    progress(len(results), len(paths), path, results[path])
+    return [row for path in paths for row in results[path]]
+
+def write_results(f, rows):
+    writer = csv.DictWriter(f, RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def print_progress(done, total, path, rows):
+    errors = [row['error'] for row in rows if row.get('error')]
+    print('[%d/%d] %s%s' % (done, total, path,
+        ' (error: '+'; '.join(errors)+')' if errors else ''),
+        file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs peak and Tg analyses over tabulated text exports '
+        'from Mettler-Toledo STARe software and writes one results table.')
+    parser.add_argument('inputs', nargs='+',
+        help='files, directories or glob patterns to analyse')
+    parser.add_argument('-s', '--spec', help='JSON file of smoothing '
+        'settings and analysis regions')
+    parser.add_argument('--peak', action='append', default=[],
+        type=parse_region, metavar='LO:HI', help='peak analysis region')
+    parser.add_argument('--tg', action='append', default=[],
+        type=parse_region, metavar='LO:HI', help='Tg analysis region')
+    parser.add_argument('-a', '--auto', action='store_true',
+        help='also analyse the peaks and glass transitions found '
+        'automatically')
+    parser.add_argument('-w', '--window', type=int,
+        help='enable Savitzky-Golay smoothing with this window size')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+        help='number of worker processes')
+    parser.add_argument('-o', '--output',
+        help='results csv (default: standard output)')
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec) if args.spec else {'analyses': []}
+    spec['analyses'] += [{'name': 'Tg %g-%g' % tuple(r), 'mode': 'tg',
+        'extents': r} for r in args.tg]
+    spec['analyses'] += [{'name': 'Peak %g-%g' % tuple(r), 'mode': 'peak',
+        'extents': r} for r in args.peak]
+    if args.auto:
+        spec['auto'] = True
+    if args.window:
+        spec['smoothing'] = {'enabled': True, 'window': args.window}
+    if not spec['analyses'] and not spec.get('auto'):
+        parser.error('no analysis regions given')
+
+    paths = expand_inputs(args.inputs)
+    rows = analyze_files(paths, spec, args.jobs, print_progress)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_results(f, rows)
+    else:
+        write_results(sys.stdout, rows)
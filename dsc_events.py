@@ -0,0 +1,107 @@
+# Automatic detection of thermal events over a whole run, proposing the
+# regions a person would otherwise select by hand. Each heating or cooling
+# segment is scanned once: peaks are found in the smoothed heat flow by their
+# prominence, and steps (glass transitions) as peaks of a step filter, the
+# difference between the mean heat flow over the next and the previous
+# EVENT_STEP_WIDTH degrees. Candidates are then analysed in batches and those
+# the analyses reject are dropped.
+import numpy as np
+import scipy.signal as ss
+from dsc import make_analysis
+
+# Smoothing window used when the data has smoothing disabled
+EVENT_WINDOW = 21
+# Width in degrees of each half of the step filter. Also the part of each end
+# of a segment that is ignored, as the start of a ramp is not settled.
+EVENT_STEP_WIDTH = 10.0
+# Minimum prominence of peaks and steps as fractions of the segment's range
+# of smoothed heat flow
+EVENT_PEAK_PROMINENCE = 0.1
+EVENT_STEP_PROMINENCE = 0.02
+# Height relative to prominence at which a peak's extent is measured, and the
+# margin added to either side as a fraction of its width
+EVENT_PEAK_REL_HEIGHT = 0.5
+EVENT_PEAK_MARGIN = 0.5
+# Half-width of a Tg region in step filter widths
+EVENT_TG_HALF_WIDTH = 1.5
+
+# Segments that events are searched in
+def event_segments(data):
+    return [(i, seg) for i, seg in enumerate(data.get_segments())
+        if seg.kind != 'iso']
+
+# Peaks in the smoothed heat flow h of a segment as (lo, hi) index extents
+def segment_peaks(h, prominence):
+    ret = []
+    for sign in (1, -1):
+        _, props = ss.find_peaks(sign*h, prominence=prominence, width=0,
+            rel_height=EVENT_PEAK_REL_HEIGHT)
+        margin = EVENT_PEAK_MARGIN*props['widths']
+        ret += zip(props['left_ips'] - margin, props['right_ips'] + margin)
+    return ret
+
+# Steps in one segment as the indices relative to h where the step filter
+# peaks. The filter's median, the baseline's slope, is taken off so that the
+# flat stretches between steps down are not taken for steps up.
+def segment_steps(h, w, prominence):
+    csum = np.r_[0, np.cumsum(h)]
+    # step[j] is for the step at j + w
+    step = (csum[2*w:] - 2*csum[w:-w] + csum[:-2*w])/w
+    step -= np.median(step)
+    ret = []
+    for sign in (1, -1):
+        peaks, _ = ss.find_peaks(sign*step, height=prominence,
+            prominence=prominence)
+        ret.append(peaks + w)
+    return np.concatenate(ret)
+
+# Proposed (mode, extents, segment) regions, extents in Tr
+def find_regions(data, modes=('peak', 'tg')):
+    window = data.savgol_1_window if data.savgol_1_enabled else EVENT_WINDOW
+    smooth = data.derivative_stack(window).order(0)
+    ret = []
+    for i, seg in event_segments(data):
+        n = seg.stop - seg.start
+        # Samples per step filter half
+        w = int(round(EVENT_STEP_WIDTH*(n - 1)/abs(seg.tr[-1] - seg.tr[0])))
+        if n < 4*w + 3 or w < 2:
+            continue
+        h = smooth[seg.start + w:seg.stop - w]
+        scale = np.ptp(h)
+        if not scale > 0:
+            continue
+
+        peaks = [(max(0, lo), min(len(h) - 1, hi))
+            for lo, hi in segment_peaks(h, EVENT_PEAK_PROMINENCE*scale)]
+        tr = seg.tr[w:n - w]
+        if 'peak' in modes:
+            ret += [('peak', sorted(np.interp((lo, hi), np.arange(len(h)),
+                tr)), i) for lo, hi in peaks]
+        if 'tg' in modes:
+            for pos in segment_steps(h, w, EVENT_STEP_PROMINENCE*scale):
+                # Either side of a peak looks like a step too
+                if any(lo <= pos <= hi for lo, hi in peaks):
+                    continue
+                half = int(EVENT_TG_HALF_WIDTH*w)
+                ret.append(('tg', sorted((seg.tr[max(0, pos + w - half)],
+                    seg.tr[min(n - 1, pos + w + half)])), i))
+    return ret
+
+# Analyses of the proposed regions that succeed, in the same shape as
+# dsc.run_analysis returns and DSCAnalysis.add_analysis takes, ordered by
+# segment and temperature
+def find_events(data, modes=('peak', 'tg')):
+    regions = find_regions(data, modes)
+    ret = []
+    for mode, detect_many in (('peak', data.peak_detect_many),
+            ('tg', data.tg_detect_many)):
+        chosen = [r for r in regions if r[0] == mode]
+        if not chosen:
+            continue
+        results = detect_many([r[1] for r in chosen],
+            [r[2] for r in chosen])
+        ret += [make_analysis(mode, extents, segment, result)
+            for (_, extents, segment), result in zip(chosen, results)
+            if result is not None]
+    ret.sort(key=lambda ana: (ana['segment'], min(ana['extents'])))
+    return ret
@@ -1,25 +1,27 @@
 import sys
 import os.path
 import datetime
-import zlib
 
 from PySide6.QtWidgets import (QApplication, QDialog, QPushButton, QMainWindow,
         QWidget, QHBoxLayout, QVBoxLayout, QTableWidget, QTableWidgetItem,
         QListWidget, QListWidgetItem, QPlainTextEdit, QLineEdit, QFileDialog,
         QLabel, QFrame, QLayout, QSizePolicy, QHeaderView, QAbstractItemView,
         QSlider, QCheckBox)
-from PySide6.QtCore import (Slot, Signal, Qt, QObject, QCoreApplication)
+from PySide6.QtCore import (Slot, Signal, Qt, QObject, QCoreApplication,
+    QTimer)
 from PySide6.QtGui import (QAction, QPalette, QColor)
 from matplotlib.backends.backend_qt5agg import (FigureCanvasQTAgg,
     NavigationToolbar2QT as NavigationToolbar)
 from matplotlib.figure import Figure
-from matplotlib.lines import Line2D
-import matplotlib.widgets as mwidgets
 
-from dsc import parse_tabulated_txt, DSCData, SAVGOL_POLYORDER
-from util import get_encoding_type
+from dsc import DSCData, SAVGOL_POLYORDER
 from dsc_analysis import DSCAnalysis
-from dsc_serialize import store_dsc, restore_dsc
+from dsc_serialize import file_state, DATA_FIELDS
+from dsc_cache import DSCCache
+from dsc_render import (DecimatedLine, data_pyramid, BlitManager,
+    BlitRectangleSelector)
+from dsc_worker import (JobQueue, load_txt_job, load_pdsc_job, save_pdsc_job,
+    analysis_job)
 
 class LoggingHandle(QObject):
     log_signal = Signal(str)
@@ -109,9 +111,18 @@ class UI_MainWindow(QMainWindow):
 
         self.active_files = []
         self.active_file_name = ''
-        self.active_file = None
         self.data = None
         self.dscanalysis = DSCAnalysis()
+        self.cache = DSCCache()
+        # State of the project file the analyses were last loaded from or
+        # saved to, and the data fields written then. Saving to the same,
+        # unchanged file only appends the edits made since.
+        self.project_file = None
+        self.saved_fields = None
+        # Files are read and written on a thread pool. Opening a file
+        # supersedes the one being read; saves are never canceled.
+        self.load_jobs = JobQueue()
+        self.save_jobs = JobQueue()
 
         # Menu
         self.menu = self.menuBar()
@@ -131,6 +142,14 @@ class UI_MainWindow(QMainWindow):
         save_action.triggered.connect(self.save_file)
         self.file_menu.addAction(save_action)
 
+        compact_action = QAction('Compact Project', self)
+        compact_action.triggered.connect(self.compact_file)
+        self.file_menu.addAction(compact_action)
+
+        cancel_load_action = QAction('Cancel Loading', self)
+        cancel_load_action.triggered.connect(self.cancel_loading)
+        self.file_menu.addAction(cancel_load_action)
+
         exit_action = QAction('Exit', self)
         exit_action.setShortcut('Ctrl+Q')
         exit_action.triggered.connect(self.exit_app)
@@ -165,12 +184,19 @@ class UI_MainWindow(QMainWindow):
         smooth_action.triggered.connect(self.smooth_dialog)
         self.analysis_menu.addAction(smooth_action)
 
+        frame_stats_action = QAction('Frame Time Stats', self)
+        frame_stats_action.triggered.connect(self.log_frame_stats)
+        self.analysis_menu.addAction(frame_stats_action)
+
         ### Central Widget
         self.pydsc = UI_PyDSC()
         self.setCentralWidget(self.pydsc)
 
         togg_1deriv_action.triggered.connect(self.pydsc.dscplot.toggle_1deriv)
 
+        self.load_jobs.progress.connect(self.pydsc.projectinfo.update_status)
+        self.save_jobs.progress.connect(self.pydsc.projectinfo.update_status)
+
         self.loaded_data.connect(self.pydsc.dscplot.load_data)
         self.loaded_data.connect(self.pydsc.results.load_data)
         self.loaded_data.connect(self.pydsc.projectinfo.receive_dsc)
@@ -224,13 +250,25 @@ class UI_MainWindow(QMainWindow):
         self.new_analysis.emit()
 
     def cancel_analysis(self, s):
+        self.pydsc.dscplot.analysis_jobs.cancel()
         self.pydsc.dscplot.update_selector(None)
 
+    def cancel_loading(self, s):
+        if self.load_jobs.busy():
+            self.load_jobs.cancel()
+            log_ui('Loading canceled')
+
     def smooth_dialog(self, s):
         dialog = PerformSmoothingDialog(self.data)
         dialog.smoothing_changed.connect(self.pydsc.dscplot.update_smoothing)
         dialog.exec()
 
+    def log_frame_stats(self, s):
+        stats = self.pydsc.dscplot.frame_stats()
+        log_ui('Frame time over last %d frames: mean %.2f ms, 95th '
+            'percentile %.2f ms' % (stats['count'], stats['mean'],
+            stats['p95']))
+
     def save_file(self, s):
         if self.data is None:
             log_ui('Save attempted with no data loaded')
@@ -248,13 +286,49 @@ class UI_MainWindow(QMainWindow):
             save_file_name = save_files[0]
             if not save_files[0].endswith('.pdsc'):
                 save_file_name = save_file_name+'.pdsc'
-            data_to_write = zlib.compress(store_dsc(self.data,
-                self.dscanalysis).encode())
-            with open(save_file_name, 'wb') as f:
-                f.write(data_to_write)
+            self.write_project(save_file_name)
+
+    # Saves in the background what is there now; edits made meanwhile are
+    # left in the journal for the next save
+    def write_project(self, path : str, compact=False):
+        if self.save_jobs.busy():
+            log_ui('Save attempted while saving')
+            return
+        fields = {k: getattr(self.data, k) for k in DATA_FIELDS}
+        journal = self.dscanalysis.journal
+        self.dscanalysis.seal_journal()
+        ops = None
+        if self.project_file is not None and \
+                self.project_file == file_state(path):
+            ops = list(journal)
+            if fields != self.saved_fields:
+                ops.append({'op': 'data', 'fields': fields})
+        data, saved = self.data, len(journal)
+        self.save_jobs.submit(save_pdsc_job, path, data,
+            [dict(a) for a in self.dscanalysis.analyses], ops, compact,
+            done=lambda state: self.saved_project(path, data, journal,
+                saved, fields, state, compact),
+            error=lambda msg: log_ui('Could not save '+path+': '+msg))
+
+    def saved_project(self, path, data, journal, saved, fields, state,
+            compact):
+        log_ui(('Compacted ' if compact else 'Saved ')+path)
+        # Unless other data was loaded meanwhile
+        if self.data is not data or self.dscanalysis.journal is not journal:
+            return
+        self.dscanalysis.journal = journal[saved:]
+        self.saved_fields = fields
+        self.project_file = state
+
+    # Folds the journal of the current project file into its header
+    def compact_file(self, s):
+        if self.project_file is None:
+            log_ui('Compaction requires a saved project')
+            return
+        self.write_project(self.project_file[0], compact=True)
 
     def open_file(self, s):
-        if self.active_file:
+        if self.data is not None:
             confirm_dialog = ConfirmDialog(
                 "Opening a new file will overwrite current data. Proceed?")
             res = confirm_dialog.exec()
@@ -277,28 +351,38 @@ class UI_MainWindow(QMainWindow):
             elif file_to_open.endswith('.pdsc'):
                 self.read_pdsc(file_to_open)
 
+    # Files are read in the background; the current data stays loaded until
+    # the new file has been read
     def read_txt(self, file_to_open : str):
-        self.active_file = open(file_to_open,
-            encoding = get_encoding_type(file_to_open))
-        text = self.active_file.read()
-        self.active_file_name = file_to_open
-
-        self.data = parse_tabulated_txt(text)
-        self.data.name = os.path.splitext(\
-            os.path.basename(self.active_file_name))[0]
+        self.load_jobs.submit(load_txt_job, file_to_open, self.cache,
+            done=lambda data: self.loaded_txt(file_to_open, data),
+            error=lambda msg: log_ui('Could not open '+file_to_open+': '+
+                msg))
 
+    def loaded_txt(self, file_to_open : str, data : DSCData):
+        self.active_file_name = file_to_open
+        self.project_file = None
+        self.data = data
         self.loaded_data.emit(self.data)
+        log_ui('Opened '+file_to_open)
 
     def read_pdsc(self, file_to_open : str):
-        self.active_file = open(file_to_open, 'rb')
-        read_bin = zlib.decompress(self.active_file.read())
-        read_data, read_analysis = restore_dsc(read_bin)
+        self.load_jobs.submit(load_pdsc_job, file_to_open,
+            done=lambda result: self.loaded_pdsc(file_to_open, *result),
+            error=lambda msg: log_ui('Could not open '+file_to_open+': '+
+                msg))
+
+    def loaded_pdsc(self, file_to_open : str, read_data : DSCData,
+            read_analysis : list, state):
         self.active_file_name = file_to_open
 
         self.data = read_data
+        self.project_file = state
+        self.saved_fields = {k: getattr(self.data, k) for k in DATA_FIELDS}
 
         self.loaded_data.emit(self.data)
         self.dscanalysis.load_analysis(read_analysis)
+        log_ui('Opened '+file_to_open)
 
     def exit_app(self, s):
         QApplication.quit()
@@ -419,6 +503,9 @@ class UI_Results(QFrame):
             ret['Enthalpy [mW]'] = pk['enthalp_area']
         return ret
 
+# Smoothing changes arriving closer together than this are applied once
+SMOOTHING_DEBOUNCE_MS = 150
+
 class UI_DSCPlot(QFrame):
     analysis_made = Signal(dict)
     canceled_analysis = Signal()
@@ -446,7 +533,21 @@ class UI_DSCPlot(QFrame):
 
         self.mode = 'tg'
 
-        self.selector = mwidgets.RectangleSelector(self.ax, self.selector_hook,
+        # Analyses of selections run in the background, each superseding
+        # the last. The request is kept to rerun it if the smoothing
+        # changes before it is done.
+        self.analysis_jobs = JobQueue()
+        self.analysis_jobs.progress.connect(log_ui)
+        self.analysis_request = None
+
+        # Smoothing settings waiting for the debounce timer
+        self.pending_smoothing = None
+        self.smoothing_timer = QTimer(self)
+        self.smoothing_timer.setSingleShot(True)
+        self.smoothing_timer.setInterval(SMOOTHING_DEBOUNCE_MS)
+        self.smoothing_timer.timeout.connect(self.apply_smoothing)
+
+        self.selector = BlitRectangleSelector(self.ax, self.selector_hook,
             useblit = True, interactive=True)
         self.selector.set_active(False) # Selector is inactive by default
         self.update_selector_props()
@@ -459,44 +560,57 @@ class UI_DSCPlot(QFrame):
         self.plot_label.setSizePolicy(
             QSizePolicy.Preferred, QSizePolicy.Fixed)
 
-        self.canvas.mpl_connect('motion_notify_event', self.motion_notify_hook)
+        # The selector and analysis markers are blitted over the curves
+        self.blit = BlitManager(self.canvas, self.ax)
+        self.blit.add_artist(*self.selector.artists)
+        self.selector.blit_manager = self.blit
 
         # Layout widgets
         self.layout.addWidget(self.plot_label)
         self.layout.addWidget(self.canvas)
         self.layout.addWidget(self.toolbar)
 
+    # Called for every change in the smoothing dialog; while the slider is
+    # dragged only the last setting is applied, once it rests
     def update_smoothing(self, active : bool, window : int):
         if self.data is None:
             return
+        self.pending_smoothing = (active, window)
+        self.smoothing_timer.start()
+
+    def apply_smoothing(self):
+        if self.data is None or self.pending_smoothing is None:
+            return
+        active, window = self.pending_smoothing
+        self.pending_smoothing = None
+        if (self.data.savgol_1_enabled, self.data.savgol_1_window) == \
+                (active, window):
+            return
         self.data.savgol_1_enabled = active
         self.data.savgol_1_window = window
         self.data.prepare_extra()
+        if self.analysis_jobs.busy():
+            self.start_analysis(*self.analysis_request)
 
-        # Replot all lines
-        plot1deriv = True if self.plot1deriv_lines else False
-        self.clear_graph()
-        self.ax.plot(self.data.Tr, self.data.Heatflow)
-        if plot1deriv:
-            self.plot1deriv_lines = self.ax.plot(
-                self.data.Tr, self.data.Heatflow1Deriv)
+        # Heatflow itself is unchanged; the derivative is redrawn in place
+        if self.plot1deriv_lines:
+            self.plot1deriv_lines.set_pyramid(
+                data_pyramid(self.data, 'Heatflow1Deriv'))
 
         # Re-perform all analyses
         self.reperform_analyses.emit(self.data)
 
-        self.canvas.draw()
-        pass
+        self.canvas.draw_idle()
 
     def toggle_1deriv(self):
         if self.data is None:
             return
         if self.plot1deriv_lines is None:
-            self.plot1deriv_lines = self.ax.plot(
-                self.data.Tr, self.data.Heatflow1Deriv)
+            self.plot1deriv_lines = DecimatedLine(self.ax,
+                data_pyramid(self.data, 'Heatflow1Deriv'))
             self.canvas.draw()
         else:
-            l = self.plot1deriv_lines.pop(0)
-            l.remove()
+            self.plot1deriv_lines.remove()
             self.plot1deriv_lines = None
             self.canvas.draw()
 
@@ -511,31 +625,30 @@ class UI_DSCPlot(QFrame):
             self.mode = None
             self.selector.set_active(False)
             self.selector.set_visible(False)
-            self.canvas.draw()
+            self.blit.update()
             return
         self.selector.extents = ana['extents']
         self.mode = ana['mode']
         self.selector.set_active(True)
         self.selector.set_visible(True)
-        self.canvas.draw()
+        self.blit.update()
 
     def selector_hook(self, eclick, erelease):
-        extents = self.selector.extents
-        try:
-            if not self.data:
-                raise Exception('No data to select')
-            if self.mode == 'tg':
-                tg = self.data.tg_detect2(extents[0], extents[1])
-                self.analysis_made.emit({'name': 'Glass Transition Analysis',
-                    'mode':self.mode, 'extents':extents, 'tg':tg})
-            elif self.mode == 'peak':
-                pk = self.data.peak_detect(extents[0], extents[1])
-                self.analysis_made.emit({'name': 'Peak Analysis',
-                    'mode':self.mode, 'extents':extents, 'peak':pk})
-        except Exception as e:
-            self.canceled_analysis.emit()
-            log_ui('Selection failed: '+str(e))
-            raise
+        if not self.data:
+            self.analysis_failed('No data to select')
+            return
+        if self.mode in ('tg', 'peak'):
+            self.start_analysis(self.mode, self.selector.extents)
+
+    def start_analysis(self, mode : str, extents):
+        self.analysis_request = (mode, extents)
+        self.analysis_jobs.submit(analysis_job, self.data.snapshot(), mode,
+            extents,
+            done=self.analysis_made.emit, error=self.analysis_failed)
+
+    def analysis_failed(self, msg : str):
+        self.canceled_analysis.emit()
+        log_ui('Selection failed: '+msg)
 
     def update_selector_props(self):
         if self.mode == 'tg':
@@ -545,16 +658,14 @@ class UI_DSCPlot(QFrame):
 
     def clear_overlay_lines(self):
         for line in self.overlay_lines:
-            if isinstance(line, Line2D):
-                self.ax.lines.remove(line)
-            else:
-                l = line.pop(0)
-                l.remove()
+            self.blit.remove_artist(line)
+            line.remove()
         self.overlay_lines = []
 
     def display_analysis(self, ana : dict):
         self.clear_overlay_lines()
         if ana is None:
+            self.blit.update()
             return
         if ana['mode'] == 'tg':
             tg = ana['tg']
@@ -578,28 +689,33 @@ class UI_DSCPlot(QFrame):
             self.overlay_lines += self.ax.plot(
                 self.data[pk['onset_Tr_idx']][0],
                 self.data[pk['onset_Tr_idx']][1], 'go')
+        self.blit.add_artist(*self.overlay_lines)
+        self.blit.update()
 
-    def motion_notify_hook(self, event):
-        if self.selector.active: # Draw rectangle
-            self.canvas.draw()
+    # Statistics of the times taken to draw the selection and markers
+    def frame_stats(self):
+        return self.blit.timer.stats()
 
     def clear_graph(self):
         if self.plot_lines:
-            l = self.plot_lines.pop(0)
-            l.remove()
+            self.plot_lines.remove()
             self.plot_lines = None
         if self.plot1deriv_lines:
-            l = self.plot1deriv_lines.pop(0)
-            l.remove()
+            self.plot1deriv_lines.remove()
             self.plot1deriv_lines = None
         self.clear_overlay_lines()
 
     def load_data(self, data : DSCData):
+        self.analysis_jobs.cancel()
+        self.smoothing_timer.stop()
+        self.pending_smoothing = None
         self.clear_graph()
 
         data.prepare_extra()
         self.data = data
-        self.plot_obj = self.ax.plot(data.Tr, data.Heatflow)
+        # Curves are drawn decimated to the view; analyses use all samples
+        self.plot_lines = DecimatedLine(self.ax,
+            data_pyramid(data, 'Heatflow'))
         self.canvas.draw()
 
 class UI_ProjectInfo(QFrame):
@@ -0,0 +1,106 @@
+# Comparison of replicate runs. One segment of each run (by default its
+# longest heating segment) is resampled onto a Tr grid common to all of them,
+# giving (N, M) arrays of Heatflow and t for N runs and M grid points, from
+# which envelopes and deviations are computed across runs at once.
+import numpy as np
+import dsc
+
+class DSCRuns:
+    # runs: DSCData objects. step: grid spacing in Tr (default the coarsest
+    # median spacing of the runs). kind: kind of segment compared.
+    def __init__(self, runs, step=None, kind='heat'):
+        self.runs = list(runs)
+        if not self.runs:
+            raise Exception('No runs')
+        self.kind = kind
+        self.segments = [self.pick_segment(data) for data in self.runs]
+        segs = [data.get_segments()[i]
+            for data, i in zip(self.runs, self.segments)]
+
+        # Grid over the range of Tr every run covers
+        lo = max(seg.sorted_tr[0] for seg in segs)
+        hi = min(seg.sorted_tr[-1] for seg in segs)
+        if not lo < hi:
+            raise Exception('Runs have no common Tr range')
+        if step is None:
+            step = max(np.median(np.abs(np.diff(seg.tr))) for seg in segs)
+        self.tr = lo + step*np.arange(int(np.floor((hi - lo)/step)) + 1)
+        self.heatflow, self.t = self.resample(segs)
+
+    # Longest segment of the kind compared
+    def pick_segment(self, data):
+        segs = [(seg.stop - seg.start, -i, i)
+            for i, seg in enumerate(data.get_segments())
+            if seg.kind == self.kind and seg.stop - seg.start >= 2]
+        if not segs:
+            raise Exception('Run has no %s segment' % self.kind)
+        return max(segs)[2]
+
+    # Interpolates Heatflow and t of every run onto the grid with one
+    # np.interp per column: run k is shifted by k times a span exceeding
+    # every run's range so that the runs follow each other along one
+    # increasing x. The shifts round x by up to a few ulps of the span times
+    # N.
+    def resample(self, segs):
+        lo = min(seg.sorted_tr[0] for seg in segs)
+        span = max(seg.sorted_tr[-1] for seg in segs) - lo + 1
+        shifts = span*np.arange(len(segs))
+        xp = np.concatenate([seg.sorted_tr - lo + shift
+            for seg, shift in zip(segs, shifts)])
+        x = ((self.tr - lo)[np.newaxis, :] + shifts[:, np.newaxis]).ravel()
+        shape = (len(segs), len(self.tr))
+        return tuple(np.interp(x, xp, np.concatenate(
+            [seg.sorted_values(getattr(data, col))
+            for data, seg in zip(self.runs, segs)])).reshape(shape)
+            for col in ('Heatflow', 't'))
+
+    def __len__(self):
+        return len(self.runs)
+
+    def mean(self):
+        return self.heatflow.mean(axis=0)
+
+    # Sample standard deviation across runs at each grid point
+    def std(self):
+        if len(self) < 2:
+            return np.zeros(len(self.tr))
+        return self.heatflow.std(axis=0, ddof=1)
+
+    # (mean - k*std, mean + k*std) at each grid point
+    def envelope(self, k=1.0):
+        mean, std = self.mean(), self.std()
+        return mean - k*std, mean + k*std
+
+    # Heatflow of each run less the mean, as an (N, M) array
+    def deviations(self):
+        return self.heatflow - self.mean()
+
+    # Root mean square deviation of each run from the mean
+    def rms_deviations(self):
+        return np.sqrt(np.mean(self.deviations()**2, axis=1))
+
+    # The mean curve as a DSCData, e.g. for analysing or plotting
+    def mean_data(self):
+        ret = dsc.DSCData()
+        ret.Index = np.arange(len(self.tr))
+        ret.t = self.t.mean(axis=0)
+        ret.Tr = self.tr
+        ret.Heatflow = self.mean()
+        ret.name = 'Mean of %d runs' % len(self)
+        return ret
+
+    # Analyses the region of the compared segment of every run, with
+    # *_detect_many's batching. Returns arrays of the values of
+    # dsc.analysis_values over the runs, NaN where a run has no result.
+    def analyze(self, mode, extents):
+        if mode not in dsc.ANALYSIS_POINTS:
+            raise Exception('Invalid mode')
+        ret = {}
+        for k, (data, segment) in enumerate(zip(self.runs, self.segments)):
+            detect_many = data.tg_detect_many if mode == 'tg' else \
+                data.peak_detect_many
+            values = dsc.analysis_values_many(data, mode,
+                detect_many([extents], [segment]))
+            for key, v in values.items():
+                ret.setdefault(key, np.full(len(self), np.nan))[k] = v[0]
+        return ret
@@ -2,6 +2,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.widgets as mwidgets
 from dsc import parse_tabulated_txt
+from dsc_render import DecimatedLine, data_pyramid
 from util import get_encoding_type
 
 # Using Qt backend
@@ -74,10 +75,12 @@ def dsc_plot(data):
             toggle_selector('tg')
         elif event.key == 'alt+d':
             # show first derivative
-            extra_lines["deriv1"] = ax.plot(data.Tr, data.Heatflow1Deriv)
+            extra_lines["deriv1"] = DecimatedLine(ax,
+                data_pyramid(data, 'Heatflow1Deriv'))
         elif event.key == 'alt+f':
             # show second derivative
-            extra_lines["deriv2"] = ax.plot(data.Tr, data.Heatflow2Deriv)
+            extra_lines["deriv2"] = DecimatedLine(ax,
+                data_pyramid(data, 'Heatflow2Deriv'))
         elif event.key == 'escape':
             toggle_selector(None)
 
@@ -85,7 +88,7 @@ def dsc_plot(data):
     fig.canvas.mpl_connect(
         'key_press_event', key_press_event)
 
-    ax.plot(data.Tr, data.Heatflow)
+    DecimatedLine(ax, data_pyramid(data, 'Heatflow'))
     ax.set_xlabel('Tr')
     ax.set_ylabel('Heatflow')
     plt.show()
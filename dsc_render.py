@@ -0,0 +1,218 @@
+# Decimation of long curves for plotting. A curve is summarised by a pyramid
+# of levels, each grouping PYRAMID_FACTOR buckets of the level below, where a
+# bucket keeps the samples with its lowest and highest y and the range of its
+# x. Drawing the lowest and highest sample of each bucket in view at the
+# finest level with no more buckets in view than the plot is wide keeps every
+# peak while drawing at most a few points per pixel. The pyramid is built
+# once per curve and only queried when the view changes; analyses keep using
+# the full-resolution data. Selections and markers are drawn over the curves
+# by blitting (see BlitManager).
+import time
+import numpy as np
+import matplotlib.widgets as mwidgets
+from collections import deque
+from util import summary_stats
+
+PYRAMID_FACTOR = 4
+# Coarsest level has at most this many buckets
+PYRAMID_MIN_BUCKETS = 1024
+# Buckets (of two points each) drawn per horizontal pixel
+BUCKETS_PER_PIXEL = 1
+
+# Groups of PYRAMID_FACTOR consecutive entries of arr, the last group padded
+# by repeating its last entry
+def grouped(arr):
+    pad = -len(arr) % PYRAMID_FACTOR
+    if pad:
+        arr = np.concatenate((arr, np.repeat(arr[-1:], pad)))
+    return arr.reshape(-1, PYRAMID_FACTOR)
+
+class MinMaxPyramid:
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        # NaN samples are never a bucket's lowest or highest unless all of
+        # it is NaN
+        y_lo = np.where(np.isnan(self.y), np.inf, self.y)
+        y_hi = np.where(np.isnan(self.y), -np.inf, self.y)
+        # Per level: positions of the lowest and highest samples and the
+        # lowest and highest x of each bucket. Level 0 is the samples.
+        i_lo = i_hi = np.arange(len(self.y))
+        x_lo = x_hi = self.x
+        self.levels = [(i_lo, i_hi, x_lo, x_hi)]
+        while len(i_lo) > PYRAMID_MIN_BUCKETS:
+            rows = np.arange((len(i_lo) + PYRAMID_FACTOR - 1)//PYRAMID_FACTOR)
+            group = grouped(i_lo)
+            i_lo = group[rows, np.argmin(y_lo[group], axis=1)]
+            group = grouped(i_hi)
+            i_hi = group[rows, np.argmax(y_hi[group], axis=1)]
+            x_lo = np.fmin.reduce(grouped(x_lo), axis=1)
+            x_hi = np.fmax.reduce(grouped(x_hi), axis=1)
+            self.levels.append((i_lo, i_hi, x_lo, x_hi))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for level in self.levels[1:] for a in level)
+
+    # Those of the buckets of a level that overlap xlo..xhi
+    def overlapping(self, level, buckets, xlo, xhi):
+        _, _, x_lo, x_hi = self.levels[level]
+        return buckets[(x_hi[buckets] >= xlo) & (x_lo[buckets] <= xhi)]
+
+    # Positions of the samples to draw for the view xlo..xhi at most buckets
+    # wide, in sample order. Levels are descended from the coarsest, looking
+    # only at the buckets within those overlapping the view, as long as the
+    # view spans no more than the given number of buckets.
+    def view_index(self, xlo, xhi, buckets):
+        level = len(self.levels) - 1
+        vis = self.overlapping(level, np.arange(len(self.levels[level][0])),
+            xlo, xhi)
+        while level > 0:
+            children = (vis[:, np.newaxis]*PYRAMID_FACTOR +
+                np.arange(PYRAMID_FACTOR)).ravel()
+            children = children[children < len(self.levels[level - 1][0])]
+            finer = self.overlapping(level - 1, children, xlo, xhi)
+            if len(finer) > buckets:
+                break
+            level, vis = level - 1, finer
+        # Neighbours too, so that lines run on out of view
+        i_lo, i_hi, _, _ = self.levels[level]
+        vis = np.unique(np.clip(np.concatenate((vis - 1, vis, vis + 1)), 0,
+            len(i_lo) - 1))
+        if level == 0:
+            return vis
+        return np.unique(np.concatenate((i_lo[vis], i_hi[vis])))
+
+    def view(self, xlo, xhi, buckets):
+        idx = self.view_index(xlo, xhi, buckets)
+        return self.x[idx], self.y[idx]
+
+    # Range of the data, as (xmin, ymin), (xmax, ymax)
+    def bounds(self):
+        if not len(self.x):
+            return None
+        return ((np.nanmin(self.x), np.nanmin(self.y)),
+            (np.nanmax(self.x), np.nanmax(self.y)))
+
+# Pyramid of Tr against a column (or derivative property) of a DSCData,
+# kept in the data's cache of derived arrays
+def data_pyramid(data, col):
+    key = ('pyramid', data.version, col)
+    if col != 'Heatflow':
+        key += (data.savgol_1_enabled, data.savgol_1_window)
+    ret = data.derivs.get(key)
+    if ret is None:
+        ret = MinMaxPyramid(data.Tr, getattr(data, col))
+        data.derivs.put(key, ret)
+    return ret
+
+# A line of an axes drawing a pyramid's view of the axes' x limits, redrawn
+# from the pyramid whenever they change. Other arguments are passed on to
+# ax.plot.
+class DecimatedLine:
+    def __init__(self, ax, pyramid, *args, **kwargs):
+        self.ax = ax
+        self.pyramid = pyramid
+        bounds = pyramid.bounds()
+        self.line, = ax.plot(*pyramid.view(-np.inf, np.inf,
+            self.buckets()), *args, **kwargs)
+        if bounds is not None:
+            ax.update_datalim(bounds)
+            ax.autoscale_view()
+        self.update()
+        # Connected through a function rather than the bound method, which
+        # the axes would only hold weakly
+        self.cid = ax.callbacks.connect('xlim_changed',
+            lambda ax: self.update())
+
+    def buckets(self):
+        return max(1, int(self.ax.bbox.width*BUCKETS_PER_PIXEL))
+
+    # Draws another curve with the same line, e.g. after smoothing changes
+    def set_pyramid(self, pyramid):
+        self.pyramid = pyramid
+        self.update()
+
+    def update(self):
+        xlo, xhi = sorted(self.ax.get_xlim())
+        self.line.set_data(*self.pyramid.view(xlo, xhi, self.buckets()))
+
+    def remove(self):
+        self.ax.callbacks.disconnect(self.cid)
+        self.line.remove()
+
+# Durations of the last FRAME_TIMES_KEPT frames, timed with "with timer:"
+FRAME_TIMES_KEPT = 1000
+
+class FrameTimer:
+    def __init__(self):
+        self.times = deque(maxlen=FRAME_TIMES_KEPT)
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.times.append(time.perf_counter() - self.start)
+
+    # summary_stats of the frame times in milliseconds
+    def stats(self):
+        return summary_stats(np.array(self.times)*1000)
+
+# Draws the animated artists of an axes (e.g. a selector's rectangle and
+# analysis markers) over a copy of the rest of it, taken after each full draw
+# of the canvas, so that moving them does not redraw the curves. The copy is
+# only retaken when the canvas is drawn in full, i.e. when the data,
+# smoothing or view change. Frames are timed by timer.
+class BlitManager:
+    def __init__(self, canvas, ax):
+        self.canvas = canvas
+        self.ax = ax
+        self.artists = []
+        self.background = None
+        self.timer = FrameTimer()
+        self.cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+    def add_artist(self, *artists):
+        for artist in artists:
+            artist.set_animated(True)
+            self.artists.append(artist)
+
+    def remove_artist(self, artist):
+        self.artists.remove(artist)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in sorted(self.artists, key=lambda a: a.get_zorder()):
+            self.ax.draw_artist(artist)
+
+    def update(self):
+        if self.background is None:
+            # Not drawn yet; on_draw takes the copy
+            self.canvas.draw_idle()
+            return
+        with self.timer:
+            self.canvas.restore_region(self.background)
+            self.draw_artists()
+            self.canvas.blit(self.ax.bbox)
+
+# Rectangle selector drawn by a BlitManager along with its other artists,
+# rather than over a background of its own
+class BlitRectangleSelector(mwidgets.RectangleSelector):
+    blit_manager = None
+
+    def update(self):
+        if not self.useblit or self.blit_manager is None:
+            return super().update()
+        self.blit_manager.update()
+        return False
+
+    # The selector's own background would be taken after it has drawn its
+    # artists over the canvas; the BlitManager takes the background instead
+    def update_background(self, event):
+        if self.blit_manager is None:
+            return super().update_background(event)
@@ -1,5 +1,31 @@
 import json
-from dsc import DSCData
+import os
+import struct
+import weakref
+import zlib
+import numpy as np
+from dsc import DSCData, COLUMNS
+
+# Project files (.pdsc) written since format version 2 start with a fixed
+# preamble followed by a JSON header describing the run, the analyses and
+# where each sample column is stored. Columns follow the header as raw
+# little-endian arrays, each optionally zlib-compressed. Version 1 files are
+# zlib-compressed JSON (store_dsc/restore_dsc).
+#
+# The columns are followed by an append-only journal of edits made since the
+# header was written (see apply_journal), so that saving analysis changes
+# does not rewrite the samples. Each record is its length and CRC-32 followed
+# by a JSON object; a torn record at the end (e.g. after a crash) fails its
+# check and is discarded together with anything after it.
+MAGIC = b'PDSC'
+FORMAT_VERSION = 2
+PREAMBLE = struct.Struct('<4sHI') # magic, version, header length
+RECORD = struct.Struct('<II') # payload length, CRC-32 of payload
+COLUMN_ALIGN = 8
+DATA_FIELDS = ('name', 'notes', 'savgol_1_window', 'savgol_1_enabled')
+# Uncompressed columns are memory-mapped, except on Windows, where a file
+# that is mapped cannot be replaced
+MAP_COLUMNS = os.name != 'nt'
 
 def store_dsc(data, analyses):
     store_dict = {
@@ -10,5 +36,198 @@ def store_dsc(data, analyses):
 def restore_dsc(text):
     restore_dict = json.loads(text)
     data = DSCData()
-    data.__dict__.update(restore_dict['data'])
+    for k, v in restore_dict['data'].items():
+        if k in COLUMNS or k in DATA_FIELDS:
+            setattr(data, k, v)
     return data, restore_dict['analyses']
+
+def pad(n):
+    return -n % COLUMN_ALIGN
+
+# Returns the version 2 encoding of data and the list of analyses
+def store_pdsc(data, analyses, compress=False):
+    blobs = []
+    columns = {}
+    offset = 0
+    for col in COLUMNS:
+        arr = np.asarray(getattr(data, col))
+        arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+        blob = np.ascontiguousarray(arr).tobytes()
+        if compress:
+            blob = zlib.compress(blob)
+        columns[col] = {'dtype': arr.dtype.str, 'count': len(arr),
+            'offset': offset, 'nbytes': len(blob),
+            'compression': 'zlib' if compress else None}
+        blobs.append(blob + bytes(pad(len(blob))))
+        offset += len(blobs[-1])
+
+    header = json.dumps({
+        'data': {k: getattr(data, k) for k in DATA_FIELDS},
+        'analyses': analyses,
+        'columns': columns}).encode()
+    # Pad the header so that columns start aligned
+    header += b' '*pad(PREAMBLE.size + len(header))
+    return b''.join([PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)),
+        header] + blobs)
+
+# Writes to a temporary file and renames it over path, so that a crash never
+# leaves a truncated project. Columns of data loaded from path that were not
+# read yet are read first (see ProjectColumns.detach).
+def save_pdsc(path, data, analyses, compress=False):
+    buf = store_pdsc(data, analyses, compress)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(buf)
+        f.flush()
+        os.fsync(f.fileno())
+    detach_pdsc(path)
+    os.replace(tmp, path)
+
+# Returns (path, size, mtime) identifying the current contents of the file
+# at path, or None if it does not exist
+def file_state(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+# Returns the version of the project file at path (1 for zlib-JSON files)
+def pdsc_version(path):
+    with open(path, 'rb') as f:
+        preamble = f.read(PREAMBLE.size)
+    if len(preamble) < PREAMBLE.size or preamble[:4] != MAGIC:
+        return 1
+    return PREAMBLE.unpack(preamble)[1]
+
+# Reads the preamble and header of a version 2 file. Returns the header and
+# the file offsets of the first column and of the journal.
+def read_header(f):
+    magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+    if version > FORMAT_VERSION:
+        raise Exception('Unsupported project file version %d' % version)
+    header = json.loads(f.read(header_len))
+    data_start = PREAMBLE.size + header_len
+    journal_start = data_start + max((info['offset'] + info['nbytes'] +
+        pad(info['nbytes']) for info in header['columns'].values()),
+        default=0)
+    return header, data_start, journal_start
+
+# Returns the journal records starting at journal_start and the offset where
+# the valid records end
+def read_journal(f, journal_start):
+    f.seek(journal_start)
+    ops = []
+    end = journal_start
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            break
+        length, crc = RECORD.unpack(head)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        ops.append(json.loads(payload))
+        end += RECORD.size + length
+    return ops, end
+
+# Replays journal records onto the list of analyses and the dict of data
+# fields (DATA_FIELDS) stored in the header
+def apply_journal(analyses, fields, ops):
+    for op in ops:
+        if op['op'] == 'add':
+            analyses.append(op['analysis'])
+        elif op['op'] == 'set':
+            analyses[op['index']] = op['analysis']
+        elif op['op'] == 'del':
+            del analyses[op['index']]
+        elif op['op'] == 'rename':
+            analyses[op['index']]['name'] = op['name']
+        elif op['op'] == 'load':
+            analyses[:] = op['analyses']
+        elif op['op'] == 'data':
+            fields.update(op['fields'])
+        else:
+            raise Exception('Unknown journal record '+str(op['op']))
+
+# Appends journal records to a version 2 project file; the cost depends only
+# on the size of the records. Any torn record left by an interrupted append
+# is cut off first.
+def append_pdsc_journal(path, ops):
+    with open(path, 'r+b') as f:
+        header, data_start, journal_start = read_header(f)
+        _, end = read_journal(f, journal_start)
+        f.seek(end)
+        f.truncate()
+        for op in ops:
+            payload = json.dumps(op).encode()
+            f.write(RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+# Rewrites a project file with its journal folded into the header
+def compact_pdsc(path, compress=False):
+    data, analyses = load_pdsc(path)
+    save_pdsc(path, data, analyses, compress)
+
+# Column loader of a DSCData read from a version 2 project file. The columns
+# are read from the file by path when first accessed, so they must be read
+# before the file is replaced (detach), which save_pdsc does for the loaders
+# of the path it writes. Files changed by other programs are not tracked.
+class ProjectColumns:
+    def __init__(self, path, data_start, columns):
+        self.path = path
+        self.data_start = data_start
+        self.columns = columns
+        self.data = None
+
+    def __call__(self, col):
+        info = self.columns[col]
+        offset = self.data_start + info['offset']
+        if info['compression'] is None and MAP_COLUMNS:
+            return np.memmap(self.path, dtype=info['dtype'], mode='r',
+                offset=offset, shape=(info['count'],))
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            blob = f.read(info['nbytes'])
+        if info['compression'] is not None:
+            blob = zlib.decompress(blob)
+        return np.frombuffer(blob, dtype=info['dtype'])
+
+    # Reads the columns of the data not read yet. Mapped columns stay valid
+    # when the file is replaced.
+    def detach(self):
+        data = self.data()
+        if data is not None:
+            for col in COLUMNS:
+                getattr(data, col)
+
+# Loaders by absolute path of the file they read
+project_loaders = {}
+
+def detach_pdsc(path):
+    for loader in project_loaders.pop(os.path.abspath(path), ()):
+        loader.detach()
+
+# Reads the header and journal of a project file. Sample columns of version 2
+# files are only read from disk (memory-mapped if uncompressed) when first
+# accessed.
+def load_pdsc(path):
+    if pdsc_version(path) == 1:
+        with open(path, 'rb') as f:
+            return restore_dsc(zlib.decompress(f.read()))
+    with open(path, 'rb') as f:
+        header, data_start, journal_start = read_header(f)
+        ops, _ = read_journal(f, journal_start)
+    analyses = header['analyses']
+    fields = header['data']
+    apply_journal(analyses, fields, ops)
+
+    loader = ProjectColumns(path, data_start, header['columns'])
+    data = DSCData(column_loader=loader)
+    loader.data = weakref.ref(data)
+    project_loaders.setdefault(os.path.abspath(path),
+        weakref.WeakSet()).add(loader)
+    for k, v in fields.items():
+        setattr(data, k, v)
+    return data, analyses
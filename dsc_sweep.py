@@ -0,0 +1,110 @@
+# Sensitivity of analysis results to the chosen region and smoothing. The
+# region's ends are jittered over a grid and every combination is analysed
+# for each smoothing window, with batched detection spread over a process
+# pool, giving the distribution of each result value.
+import argparse
+import json
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import dsc
+from util import open_text, summary_stats
+
+# Regions analysed per task
+SWEEP_CHUNK = 4096
+
+# Extents with each end moved by every one of steps offsets spread evenly
+# over +-jitter, as an (steps**2, 2) array
+def jitter_extents(extents, jitter, steps):
+    offsets = np.linspace(-jitter, jitter, steps) if steps > 1 else \
+        np.zeros(1)
+    x1, x2 = np.meshgrid(extents[0] + offsets, extents[1] + offsets,
+        indexing='ij')
+    return np.c_[x1.ravel(), x2.ravel()]
+
+# Analyses the regions with the given smoothing window (None to disable)
+def sweep_values(data, mode, extents, segment, window):
+    data.savgol_1_enabled = window is not None
+    if window is not None:
+        data.savgol_1_window = window
+    detect_many = data.tg_detect_many if mode == 'tg' else \
+        data.peak_detect_many
+    return dsc.analysis_values_many(data, mode,
+        detect_many(extents, [segment]*len(extents)))
+
+# Data analysed by the tasks of a worker process, sent once per worker
+worker_data = None
+
+def init_worker(columns):
+    global worker_data
+    worker_data = dsc.DSCData()
+    for col, values in zip(dsc.COLUMNS, columns):
+        setattr(worker_data, col, values)
+
+def sweep_task(mode, extents, segment, window):
+    return sweep_values(worker_data, mode, extents, segment, window)
+
+# Analyses the region extents with each end jittered over +-jitter in steps
+# (see jitter_extents) for each of the smoothing windows (None for no
+# smoothing). Returns the number of combinations evaluated, the number that
+# failed and summary_stats of each result value over the rest. jobs is the
+# number of processes; with 1 everything is done in this one.
+def sweep(data, mode, extents, jitter=2.0, steps=11, windows=(None,),
+        segment=None, jobs=None):
+    if mode not in dsc.ANALYSIS_POINTS:
+        raise Exception('Invalid mode')
+    if segment is None:
+        segment = data.segment_for(extents[0], extents[1])
+        if segment is None:
+            raise Exception('No data in region')
+    grid = jitter_extents(extents, jitter, steps)
+    tasks = [(mode, grid[i:i + SWEEP_CHUNK], segment, window)
+        for window in windows for i in range(0, len(grid), SWEEP_CHUNK)]
+
+    if jobs == 1:
+        enabled, window = data.savgol_1_enabled, data.savgol_1_window
+        try:
+            parts = [sweep_values(data, *task) for task in tasks]
+        finally:
+            data.savgol_1_enabled, data.savgol_1_window = enabled, window
+    else:
+        columns = [np.asarray(getattr(data, col)) for col in dsc.COLUMNS]
+        with ProcessPoolExecutor(jobs, initializer=init_worker,
+                initargs=(columns,)) as executor:
+            parts = list(executor.map(sweep_task, *zip(*tasks)))
+
+    values = {k: np.concatenate([part[k] for part in parts])
+        for k in parts[0]}
+    failed = np.isnan(next(iter(values.values())))
+    return {'evaluations': len(failed), 'failures': int(failed.sum()),
+        'stats': {k: summary_stats(v) for k, v in values.items()}}
+
+def parse_windows(s):
+    return [None if w in ('', 'none') else int(w) for w in s.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Analyses a region of a tabulated text export from '
+        'Mettler-Toledo STARe software over jittered extents and smoothing '
+        'windows and prints statistics of each result value as JSON.')
+    parser.add_argument('file', help='file to analyse')
+    parser.add_argument('mode', choices=tuple(dsc.ANALYSIS_POINTS))
+    parser.add_argument('lo', type=float)
+    parser.add_argument('hi', type=float)
+    parser.add_argument('--jitter', type=float, default=2.0,
+        help='largest shift of either end of the region')
+    parser.add_argument('--steps', type=int, default=11,
+        help='shifts of each end, spread evenly over +-jitter')
+    parser.add_argument('-w', '--windows', type=parse_windows,
+        default=[None], help='comma separated Savitzky-Golay window sizes, '
+        '"none" for no smoothing')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+        help='number of worker processes')
+    args = parser.parse_args()
+
+    with open_text(args.file) as f:
+        data = dsc.read_tabulated_txt(f)
+    json.dump(sweep(data, args.mode, (args.lo, args.hi), args.jitter,
+        args.steps, args.windows, jobs=args.jobs), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,175 @@
+# Background jobs for the GUI. Loading, saving and analysing run on a
+# QThreadPool so the window stays responsive; they report progress through
+# signals, which Qt delivers on the GUI thread. Jobs are grouped in queues by
+# the kind of request: submitting to a queue cancels the job it is running
+# and, as a job only stops at its next progress report, results of jobs that
+# have been superseded or canceled are discarded when they arrive.
+import os
+import threading
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from dsc import read_tabulated_txt, run_analysis
+from dsc_serialize import (save_pdsc, load_pdsc, append_pdsc_journal,
+    compact_pdsc, file_state, pdsc_version)
+from util import open_text
+
+# Raised inside a job at a progress report once it has been canceled
+class Canceled(Exception):
+    pass
+
+class JobSignals(QObject):
+    progress = Signal(str)
+    # Generation of the job and its result or error message
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+    # Emitted last whatever the outcome
+    ended = Signal()
+
+# Calls fn(job, *args) on a pool thread. fn reports progress with
+# job.report, which like job.check raises Canceled once the job is canceled.
+class Job(QRunnable):
+    def __init__(self, generation, fn, *args):
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.fn = fn
+        self.args = args
+        self.signals = JobSignals()
+        self.canceled = threading.Event()
+
+    def cancel(self):
+        self.canceled.set()
+
+    def check(self):
+        if self.canceled.is_set():
+            raise Canceled()
+
+    def report(self, msg):
+        self.check()
+        self.signals.progress.emit(msg)
+
+    def run(self):
+        try:
+            result = self.fn(self, *self.args)
+        except Canceled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            if not self.canceled.is_set():
+                self.signals.finished.emit(self.generation, result)
+        finally:
+            self.signals.ended.emit()
+
+# Runs jobs of one kind, the newest superseding the rest
+class JobQueue(QObject):
+    progress = Signal(str)
+
+    def __init__(self, pool=None):
+        QObject.__init__(self)
+        self.pool = pool or QThreadPool.globalInstance()
+        self.generation = 0
+        self.job = None
+        # Jobs started and not yet finished, kept referenced until then
+        self.running = set()
+
+    # Starts fn(job, *args) (see Job), canceling the current job. done is
+    # called with the result and error with the message of an exception,
+    # on the GUI thread, unless another job has been submitted since or
+    # the queue was canceled.
+    def submit(self, fn, *args, done=None, error=None):
+        self.cancel()
+        job = Job(self.generation, fn, *args)
+        job.signals.progress.connect(lambda msg: self.report(job, msg))
+        job.signals.finished.connect(
+            lambda generation, result: self.finish(generation, done, result))
+        job.signals.failed.connect(
+            lambda generation, msg: self.finish(generation, error, msg))
+        job.signals.ended.connect(lambda: self.running.discard(job))
+        self.job = job
+        self.running.add(job)
+        self.pool.start(job)
+        return job
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.generation += 1
+
+    def busy(self):
+        return self.job is not None
+
+    # Only the current job's progress is passed on
+    def report(self, job, msg):
+        if job is self.job:
+            self.progress.emit(msg)
+
+    def finish(self, generation, callback, value):
+        if generation != self.generation:
+            return
+        self.job = None
+        if callback is not None:
+            callback(value)
+
+#################### Jobs ####################
+# Rows parsed and bytes hashed between progress reports; cancellation is
+# checked at every block
+PROGRESS_ROWS = 1 << 18
+PROGRESS_BYTES = 1 << 26
+
+# A progress callback reporting msg % amount every step
+def throttled(job, msg, step):
+    reported = [0]
+    def progress(amount):
+        job.check()
+        if amount - reported[0] >= step:
+            reported[0] = amount
+            job.report(msg % amount)
+    return progress
+
+def load_txt_job(job, path, cache):
+    name = os.path.basename(path)
+    job.report('Reading '+name)
+    hashing = throttled(job, 'Checking '+name+': %d bytes', PROGRESS_BYTES)
+    data = cache.load(path, hashing)
+    if data is None:
+        with open_text(path) as f:
+            data = read_tabulated_txt(f, progress=throttled(job,
+                'Reading '+name+': %d rows', PROGRESS_ROWS))
+        job.report('Caching '+name)
+        try:
+            cache.store(path, data, hashing)
+        except OSError as e:
+            job.report('Could not cache '+path+': '+str(e))
+    data.name = os.path.splitext(name)[0]
+    job.report('Preparing '+name)
+    data.prepare_extra()
+    return data
+
+# Returns the data, analyses and state of the project file
+def load_pdsc_job(job, path):
+    job.report('Reading '+os.path.basename(path))
+    data, analyses = load_pdsc(path)
+    state = file_state(path) if pdsc_version(path) >= 2 else None
+    job.report('Preparing '+os.path.basename(path))
+    data.prepare_extra()
+    return data, analyses, state
+
+# Appends ops to the project file at path if given, otherwise writes the
+# whole project, then compacts it if asked. Returns the file's new state.
+def save_pdsc_job(job, path, data, analyses, ops, compact):
+    job.report('Saving '+os.path.basename(path))
+    if ops is not None:
+        append_pdsc_journal(path, ops)
+    else:
+        save_pdsc(path, data, analyses)
+    if compact:
+        job.report('Compacting '+os.path.basename(path))
+        compact_pdsc(path)
+    return file_state(path)
+
+# data should be a snapshot (DSCData.snapshot) taken when the job was
+# submitted, so that smoothing changes made meanwhile are not seen part way
+def analysis_job(job, data, mode, extents):
+    job.report('Analysing %g-%g' % (extents[0], extents[1]))
+    return run_analysis(data, mode, extents)
@@ -1,34 +1,90 @@
 import argparse
 import dsc
-import csv
 import os
-from util import get_encoding_type
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from util import open_text, expand_inputs
+
+FORMATS = ('csv', 'npy', 'npz')
+# Rows formatted per write when producing csv
+CSV_BLOCK_ROWS = 1 << 16
+
+def output_path(fi, fmt, outdir=None):
+    base = os.path.splitext(os.path.abspath(fi))[0]
+    if outdir:
+        base = os.path.join(outdir, os.path.basename(base))
+    return base+'.'+fmt
+
+# Writes rows the way csv.writer would, formatting a whole block of rows
+# with a single string operation
+def write_csv(f, data):
+    f.write('Index,t,Heatflow,Tr\r\n') # Header
+    cols = (data.Index, data.t, data.Heatflow, data.Tr)
+    for start in range(0, len(data.Index), CSV_BLOCK_ROWS):
+        block = [col[start:start + CSV_BLOCK_ROWS].tolist() for col in cols]
+        flat = [None]*(4*len(block[0]))
+        for k, col in enumerate(block):
+            flat[k::4] = col
+        f.write(('%d,%r,%r,%r\r\n'*len(block[0])) % tuple(flat))
+
+# Binary output: one structured array (npy) or one array per column (npz)
+def write_npy(f, data):
+    arr = np.empty(len(data.Index), dtype=[('Index', '<i8'), ('t', '<f8'),
+        ('Heatflow', '<f8'), ('Tr', '<f8')])
+    for col in dsc.COLUMNS:
+        arr[col] = getattr(data, col)
+    np.save(f, arr)
+
+def write_npz(f, data):
+    np.savez(f, **{col: getattr(data, col) for col in dsc.COLUMNS})
+
+def convert(fi, fmt='csv', outdir=None, force=False):
+    new_file_name = output_path(fi, fmt, outdir)
+    if os.path.exists(new_file_name) and not force:
+        raise Exception(new_file_name+' already exists.'
+        ' Specify force option to overwrite.')
+
+    with open_text(fi) as f:
+        data = dsc.read_tabulated_txt(f)
+
+    if fmt == 'csv':
+        with open(new_file_name, 'w', newline='') as f:
+            write_csv(f, data)
+    else:
+        with open(new_file_name, 'wb') as f:
+            (write_npy if fmt == 'npy' else write_npz)(f, data)
+    return new_file_name
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Converts tabulated text from Mettler-Toledo STARe '
-        'software to csv.')
-    parser.add_argument('file', help='file to convert to csv')
-    parser.add_argument('-f', '--force', help='overwrite existing csvs',
+        'software to csv (or numpy npy/npz).')
+    parser.add_argument('files', nargs='+',
+        help='files, directories or glob patterns to convert')
+    parser.add_argument('-f', '--force', help='overwrite existing outputs',
         action='store_true')
+    parser.add_argument('-t', '--format', choices=FORMATS, default='csv',
+        help='output format')
+    parser.add_argument('-d', '--outdir',
+        help='directory for outputs (default: next to inputs)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+        help='number of worker processes')
     args = parser.parse_args()
-    data = {}
-
-    new_file_name = os.path.splitext(os.path.abspath(args.file))[0]+'.csv'
-    if os.path.exists(new_file_name) and not args.force:
-        raise Exception('CSV output file already exists.'
-        ' Specify force option to overwrite.')
-
-    with open(args.file,
-            encoding = get_encoding_type(args.file)) as f:
-        text = f.read()
-        data = dsc.parse_tabulated_txt(text)
-
-    with open(new_file_name, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Index','t','Heatflow','Tr']) # Header
-        for i in data.Index:
-            #assert(data['Index'][i]==i)
-            writer.writerow([data.Index[i],
-                data.t[i], data.Heatflow[i], data.Tr[i]])
 
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+    files = expand_inputs(args.files)
+    failed = 0
+    with ProcessPoolExecutor(args.jobs) as executor:
+        futures = {executor.submit(convert, fi, args.format, args.outdir,
+            args.force): fi for fi in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                msg = future.result()
+            except Exception as e:
+                msg = 'error: '+str(e)
+                failed += 1
+            print('[%d/%d] %s -> %s' % (done, len(files), futures[future],
+                msg), file=sys.stderr)
+    sys.exit(1 if failed else 0)
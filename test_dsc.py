@@ -1,4 +1,6 @@
 import dsc
+import io
+import numpy as np
 import unittest
 
 TEST_TEXT = '''         Index             t      Heatflow            Tr
@@ -18,5 +20,226 @@ class TestDSC(unittest.TestCase):
         self.assertEqual(data.Heatflow[0], -8.42906e-2)
         self.assertEqual(data.Heatflow[1], -1.02480e-1)
 
+    def test_columns(self):
+        data = dsc.parse_tabulated_txt(TEST_TEXT)
+        version = data.version
+        data.t = [0, 1]
+        self.assertGreater(data.version, version)
+        self.assertEqual(data.t.dtype, np.float64)
+        self.assertIs(data.np_Tr, data.Tr)
+        with self.assertRaises(ValueError):
+            data.Heatflow[0] = 0
+        with self.assertRaises(AttributeError):
+            data.extra = 0
+
+    def test_parse_matches_regex(self):
+        ragged = TEST_TEXT.replace('  0.00000e+000', ' 0.0', 1)
+        odd = TEST_TEXT.replace('\n             1',
+            '\n# comment\n             1')
+        for text in (TEST_TEXT, ragged, odd):
+            data = dsc.parse_tabulated_txt(text)
+            ref = dsc.parse_tabulated_txt_regex(text)
+            for col in ('Index', 't', 'Heatflow', 'Tr'):
+                self.assertEqual(getattr(data, col).dtype,
+                    getattr(ref, col).dtype)
+                np.testing.assert_array_equal(getattr(data, col),
+                    getattr(ref, col))
+            self.assertEqual(data.notes, ref.notes)
+        self.assertEqual(data.notes, 'PET_group2, 02.02.2022 20:36:15')
+
+    def test_parse_fixed_width(self):
+        start, end, _ = dsc.locate_data_block(TEST_TEXT)
+        cols = dsc.parse_fixed_width_block(TEST_TEXT[start:end].encode())
+        np.testing.assert_array_equal(cols[3], [25.0, 25.1667])
+        self.assertIsNone(dsc.parse_fixed_width_block(b'1 2.0 3.0 4.0\n'
+            b'10 2.0 3.0 4.0\n'))
+
+    def test_read_chunks(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            text = f.read()
+        ref = dsc.parse_tabulated_txt(text)
+        for chunk_size in (7, 100, 4096, len(text) + 1):
+            data = dsc.read_tabulated_txt(io.StringIO(text), chunk_size)
+            for col in ('Index', 't', 'Heatflow', 'Tr'):
+                np.testing.assert_array_equal(getattr(data, col),
+                    getattr(ref, col))
+            self.assertEqual(data.notes, ref.notes)
+        blocks = list(dsc.iter_tabulated_txt(io.StringIO(text), 4096))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(sum(len(b.Index) for b in blocks), len(ref.Index))
+        rows = []
+        dsc.read_tabulated_txt(io.StringIO(text), 4096, progress=rows.append)
+        self.assertEqual(len(rows), len(blocks))
+        self.assertEqual(rows, sorted(rows))
+        self.assertEqual(rows[-1], len(ref.Index))
+
+    def test_tr_selection(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        data.prepare_extra()
+        sel = data.tr_selection(262, 225)
+        self.assertIsInstance(sel, slice)
+        np.testing.assert_array_equal(data.Tr[sel],
+            data.Tr[data.get_tr_selection_mask(225, 262)])
+        peak = data.peak_detect(225, 262)
+        # Results are positions, whatever the Index column holds
+        data.Index = data.Index + 100
+        self.assertEqual(data.peak_detect(225, 262), peak)
+        # Selections on non-monotonic Tr
+        data.Tr = data.Tr[::-1]
+        np.testing.assert_array_equal(data.Tr[data.tr_selection(225, 262)],
+            data.Tr[data.get_tr_selection_mask(225, 262)])
+
+    def test_segments(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            ref = dsc.parse_tabulated_txt(f.read())
+        ref.prepare_extra()
+        # Heat, hold, cool, heat
+        hold = np.full(100, ref.Tr[-1])
+        data = dsc.DSCData()
+        data.Tr = np.concatenate([ref.Tr, hold, ref.Tr[::-1], ref.Tr])
+        data.Heatflow = np.concatenate([ref.Heatflow, np.zeros(100),
+            -ref.Heatflow[::-1], ref.Heatflow])
+        data.t = np.arange(len(data.Tr))
+        data.Index = data.t
+        data.prepare_extra()
+        segments = data.get_segments()
+        self.assertEqual([seg.kind for seg in segments],
+            ['heat', 'iso', 'cool', 'heat'])
+        self.assertEqual(data.segment_for(225, 262), 0)
+        last = segments[3]
+        sel = data.tr_selection(225, 262, 3)
+        self.assertTrue(np.all((data.Tr[sel] > 225) & (data.Tr[sel] < 262)))
+        self.assertGreaterEqual(sel.start, last.start)
+        peak = data.peak_detect(225, 262, 3)
+        self.assertEqual(peak['peak_idx'] - last.start,
+            ref.peak_detect(225, 262)['peak_idx'])
+        cool = data.peak_detect(225, 262, 2)
+        self.assertGreater(cool['enthalp_area'], 0)
+
+    def test_nearest(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        heating = data.Tr
+        pos = data.nearest_tr_idx(100.05, 0, interpolate=True)
+        self.assertAlmostEqual(data.sample_at(pos)[0], 100.05)
+        rng = np.random.default_rng(0)
+        noisy = np.round(data.Tr + rng.normal(0, 0.3, len(data.Tr)), 1)
+        for tr in (data.Tr, data.Tr[::-1], noisy):
+            data.Tr = tr
+            for x in np.r_[rng.uniform(0, 320, 200), tr[:20]]:
+                self.assertEqual(data.nearest_tr_idx(x),
+                    np.argmin(np.abs(tr - x)))
+        # The midpoint lies between the extrapolated onset and end
+        data.Tr = heating
+        data.prepare_extra()
+        tg = data.tg_detect2(45, 85)
+        self.assertLessEqual(tg['tf_idx'], tg['tm_idx'])
+        self.assertLess(data.Tr[tg['tm_idx']], 85)
+
+    def test_detect_many(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        data.prepare_extra()
+        rng = np.random.default_rng(0)
+        x1 = rng.uniform(30, 290, 200)
+        extents = np.c_[x1, x1 + rng.uniform(-40, 40, 200)]
+        extents[0] = (310, 320) # No samples
+        peaks = data.peak_detect_many(extents)
+        tgs = data.tg_detect_many(extents)
+        self.assertIsNone(peaks[0])
+        self.assertIsNone(tgs[0])
+        for (x1, x2), peak, tg in zip(extents, peaks, tgs):
+            if peak is None:
+                self.assertRaises(ValueError, data.peak_detect, x1, x2)
+                continue
+            ref = data.peak_detect(x1, x2)
+            self.assertAlmostEqual(peak.pop('enthalp_area'),
+                ref.pop('enthalp_area'))
+            self.assertEqual(peak, ref)
+            self.assertEqual(tg, data.tg_detect2(x1, x2))
+
+    def test_deriv_cache(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        raw = data.Heatflow1Deriv
+        np.testing.assert_array_equal(raw,
+            np.gradient(data.Heatflow, data.Tr))
+        data.savgol_1_enabled = True
+        data.savgol_1_window = 11
+        smooth = data.Heatflow1Deriv
+        self.assertFalse(np.array_equal(raw, smooth))
+        data.savgol_1_enabled = False
+        self.assertIs(data.Heatflow1Deriv, raw)
+        data.Heatflow = data.Heatflow*2 # New data version
+        np.testing.assert_array_equal(data.Heatflow1Deriv, 2*raw)
+
+    def test_derivative_stack(self):
+        data = dsc.DSCData()
+        data.t = np.arange(200)*0.5
+        data.Tr = 25 + data.t/6
+        data.Heatflow = data.Tr**3/3
+        data.Index = np.arange(200)
+        data.savgol_1_enabled = True
+        data.savgol_1_window = 9
+        np.testing.assert_allclose(data.Heatflow1Deriv, data.Tr**2)
+        # Only the row and time derivatives used are held, and counted
+        stack = data.derivative_stack(9)
+        self.assertEqual(stack.nbytes, 3*data.Tr.nbytes)
+        self.assertEqual(data.derivs.nbytes, stack.nbytes)
+        np.testing.assert_allclose(data.Heatflow2Deriv, 2*data.Tr)
+        np.testing.assert_allclose(stack.order(0), data.Heatflow)
+        self.assertEqual(set(stack.rows), {0, 1, 2})
+
+    def test_region_deriv(self):
+        data = dsc.DSCData()
+        data.t = np.arange(3000)*0.5
+        data.Tr = np.r_[25 + data.t[:1000]/6, np.full(500, 108.5),
+            108.5 - data.t[:1500]/6]
+        data.Heatflow = np.sin(data.Tr/7)
+        data.Index = np.arange(3000)
+        for enabled in (False, True):
+            data.savgol_1_enabled = enabled
+            data.savgol_1_window = 11
+            full = np.array(data.Heatflow1Deriv)
+            for start, stop in ((0, 3), (500, 520), (995, 1510), (2990, 3000)):
+                np.testing.assert_array_equal(
+                    data.compute_deriv1_range(start, stop), full[start:stop])
+            data.derivs.clear()
+            threshold = dsc.LOCAL_DERIV_MIN_SAMPLES
+            dsc.LOCAL_DERIV_MIN_SAMPLES = 100
+            try:
+                idx = np.array([2999, 5, 6, 1700, 5])
+                np.testing.assert_array_equal(data.deriv1[idx], full[idx])
+                np.testing.assert_array_equal(data.deriv1[40:900],
+                    full[40:900])
+                self.assertEqual(data.deriv1[2200], full[2200])
+            finally:
+                dsc.LOCAL_DERIV_MIN_SAMPLES = threshold
+        # A snapshot keeps its smoothing while the data's changes, and
+        # shares the cache under keys matching what it computed
+        snap = data.snapshot()
+        data.savgol_1_enabled = False
+        self.assertTrue(snap.savgol_1_enabled)
+        self.assertIs(snap.derivs, data.derivs)
+        np.testing.assert_array_equal(snap.deriv1_range(40, 900),
+            full[40:900])
+        data.savgol_1_enabled = True
+        self.assertIs(data.deriv1_range(40, 900), snap.deriv1_range(40, 900))
+
+    def test_region_area(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        baseline = (-1e-3, -2.0)
+        for l, r in ((0, 1650), (200, 201), (900, 1400)):
+            t = data.t[l:r + 1]
+            self.assertAlmostEqual(data.region_area(l, r, baseline),
+                dsc.trapezoid(data.Heatflow[l:r + 1] -
+                (baseline[0]*t + baseline[1]), t))
+        np.testing.assert_allclose(data.region_area([0, 900], [1650, 1400]),
+            [dsc.trapezoid(data.Heatflow, data.t),
+            dsc.trapezoid(data.Heatflow[900:1401], data.t[900:1401])])
+        self.assertEqual(data.region_area(5, 5, (np.nan, np.nan)), 0)
+
 if __name__ == '__main__':
     unittest.main()
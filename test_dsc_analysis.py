@@ -0,0 +1,51 @@
+import unittest
+import dsc
+from dsc_analysis import DSCAnalysis
+from dsc_serialize import apply_journal
+
+class TestAnalysis(unittest.TestCase):
+    def test_update_all_analyses(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        data.prepare_extra()
+        analysis = DSCAnalysis()
+        # As stored from the selector: xmin, xmax, ymin, ymax
+        analysis.load_analysis([
+            {'name': 'Tg 1', 'mode': 'tg', 'extents': [40.0, 90.0, -3.0, 0.0]},
+            {'name': 'Tg 2', 'mode': 'tg',
+                'extents': [200.0, 260.0, -3.0, 0.0]},
+            {'name': 'Peak', 'mode': 'peak',
+                'extents': [200.0, 260.0, -3.0, 0.0]}])
+        analysis.update_all_analyses(data)
+        for ana in analysis.analyses:
+            x1, x2 = ana['extents'][:2]
+            if ana['mode'] == 'tg':
+                self.assertEqual(ana['tg'], data.tg_detect2(x1, x2))
+            else:
+                self.assertEqual(ana['peak']['peak_idx'],
+                    data.peak_detect(x1, x2)['peak_idx'])
+        self.assertRaises(Exception, data.tg_detect_many,
+            [[40.0, 90.0, -3.0, 0.0]])
+
+        # Smoothing changes rewrite the unsaved records of the last one
+        self.assertEqual(len(analysis.journal), 3)
+        data.savgol_1_enabled = True
+        for window in (11, 21):
+            data.savgol_1_window = window
+            analysis.update_all_analyses(data)
+        self.assertEqual(len(analysis.journal), 3)
+        replayed = [dict(a) for a in analysis.analyses]
+        apply_journal(replayed, {}, analysis.journal)
+        self.assertEqual(replayed, analysis.analyses)
+        # Unchanged results add nothing; saved records are kept
+        analysis.update_all_analyses(data)
+        self.assertEqual(len(analysis.journal), 3)
+        saved = list(analysis.journal)
+        analysis.seal_journal()
+        data.savgol_1_enabled = False
+        analysis.update_all_analyses(data)
+        self.assertGreater(len(analysis.journal), 3)
+        self.assertEqual(analysis.journal[:3], saved)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import dsc
+from dsc_cache import DSCCache
+
+class TestDSCCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = DSCCache(os.path.join(self.dir, 'cache'))
+        self.src = os.path.join(self.dir, 'run.txt')
+        shutil.copy('example_tabulated.txt', self.src)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        self.assertIsNone(self.cache.load(self.src))
+        with open(self.src, encoding='latin-1') as f:
+            data = dsc.read_tabulated_txt(f)
+        self.cache.store(self.src, data)
+
+        cached = self.cache.load(self.src)
+        self.assertIsInstance(cached.Tr, np.memmap)
+        np.testing.assert_array_equal(cached.Heatflow, data.Heatflow)
+        self.assertEqual(cached.notes, data.notes)
+
+        # Changing the source invalidates its entry
+        with open(self.src, 'a') as f:
+            f.write('\n')
+        self.assertIsNone(self.cache.load(self.src))
+
+    def test_evict(self):
+        with open(self.src, encoding='latin-1') as f:
+            data = dsc.read_tabulated_txt(f)
+        self.cache.max_bytes = 0
+        self.cache.store(self.src, data)
+        other = os.path.join(self.dir, 'other.txt')
+        shutil.copy(self.src, other)
+        with open(other, 'a') as f:
+            f.write('\n')
+        self.cache.store(other, data)
+        self.assertIsNone(self.cache.load(self.src))
+        self.assertIsNotNone(self.cache.load(other))
+
+    def test_progress(self):
+        sizes = []
+        self.assertIsNone(self.cache.load(self.src, sizes.append))
+        self.assertEqual(sizes[-1], os.path.getsize(self.src))
+
+if __name__ == '__main__':
+    unittest.main()
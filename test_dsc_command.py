@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from dsc_command import analyze_files
+from util import expand_inputs
+
+SPEC = {'analyses': [{'name': 'Tg', 'mode': 'tg', 'extents': [60, 95]},
+    {'name': 'Melt', 'mode': 'peak', 'extents': [225, 262]},
+    {'name': 'Outside', 'mode': 'peak', 'extents': [400, 500]}]}
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        shutil.copy('example_tabulated.txt', os.path.join(self.dir, 'a.txt'))
+        with open(os.path.join(self.dir, 'b.txt'), 'w') as f:
+            f.write('not an export')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_analyze_files(self):
+        paths = expand_inputs([self.dir])
+        self.assertEqual([os.path.basename(p) for p in paths],
+            ['a.txt', 'b.txt'])
+        rows = analyze_files(paths, SPEC, jobs=1)
+        self.assertEqual(len(rows), 4)
+        tg, melt, outside, bad = rows
+        self.assertAlmostEqual(tg['tig_Tr'], 81.8333)
+        self.assertLess(melt['enthalp_area'], 0)
+        self.assertNotIn('error', melt)
+        self.assertIn('error', outside)
+        self.assertEqual(bad['file'], paths[1])
+        self.assertIn('error', bad)
+
+    def test_auto(self):
+        rows = analyze_files(expand_inputs([self.dir])[:1],
+            {'auto': True}, jobs=1)
+        self.assertIn('peak', [row['mode'] for row in rows])
+        self.assertFalse(any(row.get('error') for row in rows))
+
+if __name__ == '__main__':
+    unittest.main()
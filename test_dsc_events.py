@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+import dsc
+import dsc_events
+
+class TestEvents(unittest.TestCase):
+    def test_find_events(self):
+        rng = np.random.default_rng(0)
+        data = dsc.DSCData()
+        data.t = np.arange(2800)*0.6
+        data.Tr = 20 + data.t/6
+        data.Index = np.arange(2800)
+        # Sloping baseline, a step at 100 and an endotherm at 220
+        data.Heatflow = -0.002*data.Tr - \
+            0.2/(1 + np.exp(-(data.Tr - 100)/2)) - \
+            1.5*np.exp(-((data.Tr - 220)/4)**2/2) + \
+            rng.normal(0, 1e-3, 2800)
+        events = dsc_events.find_events(data)
+        self.assertEqual([ana['mode'] for ana in events], ['tg', 'peak'])
+        tg, peak = events
+        self.assertTrue(tg['extents'][0] < 100 < tg['extents'][1])
+        self.assertAlmostEqual(data.Tr[peak['peak']['peak_idx']], 220,
+            delta=1)
+        self.assertEqual(set(peak), {'name', 'mode', 'extents', 'segment',
+            'peak'})
+        self.assertEqual(dsc_events.find_events(data, ('peak',)), [peak])
+
+    def test_example(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            data = dsc.parse_tabulated_txt(f.read())
+        peaks = dsc_events.find_events(data, ('peak',))
+        self.assertEqual(len(peaks), 1)
+        lo, hi = peaks[0]['extents']
+        self.assertTrue(lo < 248 < hi)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import dsc
+from dsc_multi import DSCRuns
+
+def make_run(t, tr, heatflow):
+    ret = dsc.DSCData()
+    ret.Index = np.arange(len(t))
+    ret.t, ret.Tr, ret.Heatflow = t, tr, heatflow
+    return ret
+
+class TestMulti(unittest.TestCase):
+    def setUp(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            self.ref = dsc.parse_tabulated_txt(f.read())
+        rng = np.random.default_rng(0)
+        self.runs = [make_run(self.ref.t, self.ref.Tr + shift,
+            self.ref.Heatflow + rng.normal(0, 0.01, len(self.ref.t)))
+            for shift in (-0.3, 0, 0.2)]
+
+    def test_resample(self):
+        runs = DSCRuns(self.runs)
+        self.assertEqual(runs.heatflow.shape, (3, len(runs.tr)))
+        self.assertAlmostEqual(runs.tr[0], 25.2)
+        self.assertLessEqual(runs.tr[-1], 299.7)
+        for data, row in zip(self.runs, runs.heatflow):
+            np.testing.assert_allclose(row,
+                np.interp(runs.tr, data.Tr, data.Heatflow), atol=1e-12)
+        np.testing.assert_allclose(runs.deviations().sum(axis=0), 0,
+            atol=1e-12)
+        lo, hi = runs.envelope()
+        self.assertTrue(np.all(lo <= runs.mean()) and
+            np.all(runs.mean() <= hi))
+
+        # A cooling run compares the same way
+        cool = make_run(self.ref.t, self.ref.Tr[::-1],
+            self.ref.Heatflow[::-1])
+        runs = DSCRuns([cool, cool], kind='cool')
+        np.testing.assert_allclose(runs.heatflow[1],
+            np.interp(runs.tr, self.ref.Tr, self.ref.Heatflow), atol=1e-12)
+        np.testing.assert_allclose(runs.std(), 0, atol=1e-12)
+        np.testing.assert_allclose(runs.rms_deviations(), 0, atol=1e-12)
+        self.assertRaises(Exception, DSCRuns, [cool])
+
+    def test_analyze(self):
+        values = DSCRuns(self.runs).analyze('tg', (60, 95))
+        for k, data in enumerate(self.runs):
+            ref = dsc.analysis_values(data,
+                dsc.run_analysis(data, 'tg', (60, 95)))
+            self.assertEqual({key: v[k] for key, v in values.items()}, ref)
+
+if __name__ == '__main__':
+    unittest.main()
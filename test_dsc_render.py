@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import dsc_render
+from dsc_render import MinMaxPyramid
+
+class TestRender(unittest.TestCase):
+    def test_pyramid(self):
+        n = 100000
+        x = np.r_[np.linspace(0, 100, n//2), np.linspace(100, 0, n//2)]
+        y = np.sin(x)
+        y[12345] = 10 # Spike
+        y[60000:60010] = np.nan
+        pyramid = MinMaxPyramid(x, y)
+        self.assertGreater(len(pyramid.levels), 1)
+
+        xs, ys = pyramid.view(-np.inf, np.inf, 1000)
+        self.assertLessEqual(len(xs), 2*dsc_render.PYRAMID_MIN_BUCKETS)
+        self.assertEqual(np.nanmax(ys), 10)
+        self.assertEqual(np.nanmin(ys), np.nanmin(y))
+
+        # Zoomed in far enough, every sample in view is drawn
+        idx = pyramid.view_index(50, 50.5, 1000)
+        in_view = np.flatnonzero((x >= 50) & (x <= 50.5))
+        self.assertTrue(np.isin(in_view, idx).all())
+        self.assertLessEqual(len(idx), len(in_view) + 4)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+        # Zoomed in partly, the lowest and highest points are kept
+        xs, ys = pyramid.view(20, 30, 100)
+        self.assertLess(len(xs), 400)
+        self.assertEqual(ys.max(), 10)
+        self.assertEqual(len(pyramid.view(200, 300, 100)[0]), 0)
+
+    def test_blit_manager(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        ax = fig.add_subplot()
+        canvas = FigureCanvasAgg(fig)
+        x = np.linspace(0, 100, 100000)
+        line = dsc_render.DecimatedLine(ax, MinMaxPyramid(x, np.sin(x)))
+        artist = line.line
+        line.set_pyramid(MinMaxPyramid(x, np.cos(x)))
+        self.assertIs(line.line, artist)
+        self.assertEqual(artist.get_ydata()[0], 1)
+        blit = dsc_render.BlitManager(canvas, ax)
+        marker, = ax.plot([20], [0.5], 'ro')
+        blit.add_artist(marker)
+        self.assertTrue(marker.get_animated())
+        self.assertIsNone(blit.background)
+        canvas.draw()
+        self.assertIsNotNone(blit.background)
+        for i in range(5):
+            marker.set_xdata([20 + i])
+            blit.update()
+        self.assertEqual(blit.timer.stats()['count'], 5)
+
+    def test_blit_selector(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        ax = fig.add_subplot()
+        canvas = FigureCanvasAgg(fig)
+        x = np.linspace(0, 100, 1000)
+        dsc_render.DecimatedLine(ax, MinMaxPyramid(x, np.sin(x)))
+        # Connected to draw events before the BlitManager, as in the GUI
+        selector = dsc_render.BlitRectangleSelector(ax, lambda *a: None,
+            useblit=True, interactive=True)
+        blit = dsc_render.BlitManager(canvas, ax)
+        blit.add_artist(*selector.artists)
+        selector.blit_manager = blit
+        marker, = ax.plot([20], [0.5], 'ro')
+        blit.add_artist(marker)
+        selector.extents = (20, 60, -0.5, 0.5)
+        selector.set_visible(True)
+        canvas.draw()
+        background = np.array(blit.background)
+        # The background is the axes without the selector and markers
+        for artist in blit.artists:
+            artist.set_visible(False)
+        canvas.draw()
+        np.testing.assert_array_equal(background,
+            np.array(canvas.copy_from_bbox(ax.bbox)))
+
+if __name__ == '__main__':
+    unittest.main()
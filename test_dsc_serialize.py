@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+import numpy as np
+import dsc
+from dsc_serialize import (save_pdsc, load_pdsc, store_dsc,
+    append_pdsc_journal, compact_pdsc)
+
+ANALYSES = [{'name': 'Peak Analysis', 'mode': 'peak',
+    'extents': [200.0, 260.0, -3.0, 0.0]}]
+
+class Analyses:
+    analyses = ANALYSES
+
+class TestSerialize(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            self.data = dsc.read_tabulated_txt(f)
+        self.data.name = 'example'
+        self.data.savgol_1_enabled = True
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assert_same_data(self, data, notes=True):
+        for col in dsc.COLUMNS:
+            np.testing.assert_array_equal(getattr(data, col),
+                getattr(self.data, col))
+        if notes:
+            self.assertEqual(data.notes, self.data.notes)
+
+    def test_roundtrip(self):
+        for compress in (False, True):
+            path = os.path.join(self.dir, 'run.pdsc')
+            save_pdsc(path, self.data, ANALYSES, compress)
+            data, analyses = load_pdsc(path)
+            self.assertNotIn('Tr', data.columns) # Not read yet
+            self.assert_same_data(data)
+            self.assertTrue(data.savgol_1_enabled)
+            self.assertEqual(analyses, ANALYSES)
+
+    def test_legacy(self):
+        path = os.path.join(self.dir, 'old.pdsc')
+        with open(path, 'wb') as f:
+            f.write(zlib.compress(store_dsc(self.data, Analyses).encode()))
+        data, analyses = load_pdsc(path)
+        self.assert_same_data(data)
+        self.assertEqual(analyses, ANALYSES)
+
+    def test_journal(self):
+        path = os.path.join(self.dir, 'run.pdsc')
+        save_pdsc(path, self.data, ANALYSES)
+        size = os.path.getsize(path)
+        tg = {'name': 'Glass Transition Analysis', 'mode': 'tg',
+            'extents': [70.0, 90.0, -3.0, 0.0]}
+        append_pdsc_journal(path, [{'op': 'add', 'analysis': tg},
+            {'op': 'rename', 'index': 1, 'name': 'Tg'},
+            {'op': 'del', 'index': 0},
+            {'op': 'data', 'fields': {'notes': 'edited'}}])
+        self.assertLess(os.path.getsize(path) - size, 1000)
+        data, analyses = load_pdsc(path)
+        self.assertEqual(analyses, [dict(tg, name='Tg')])
+        self.assertEqual(data.notes, 'edited')
+
+        # A torn record is ignored and cut off by the next append
+        with open(path, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00garbage')
+        self.assertEqual(load_pdsc(path)[1], [dict(tg, name='Tg')])
+        append_pdsc_journal(path, [{'op': 'rename', 'index': 0,
+            'name': 'Tg 2'}])
+        self.assertEqual(load_pdsc(path)[1][0]['name'], 'Tg 2')
+
+        compact_pdsc(path)
+        data, analyses = load_pdsc(path)
+        self.assertEqual(analyses[0]['name'], 'Tg 2')
+        self.assertEqual(data.notes, 'edited')
+        self.assert_same_data(data, notes=False)
+
+    def test_replace_loaded(self):
+        for compress in (False, True):
+            path = os.path.join(self.dir, 'run.pdsc')
+            save_pdsc(path, self.data, ANALYSES, compress)
+            data, analyses = load_pdsc(path)
+            data.Tr, data.Heatflow
+            append_pdsc_journal(path, [{'op': 'del', 'index': 0}])
+            compact_pdsc(path)
+            # Columns not read before are those of the file as loaded
+            self.assert_same_data(data)
+            save_pdsc(path, data, analyses)
+            self.assert_same_data(load_pdsc(path)[0])
+
+if __name__ == '__main__':
+    unittest.main()
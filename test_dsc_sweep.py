@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+import dsc
+import dsc_sweep
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        with open('example_tabulated.txt', encoding='latin-1') as f:
+            self.data = dsc.parse_tabulated_txt(f.read())
+
+    def test_jitter_extents(self):
+        grid = dsc_sweep.jitter_extents((60, 95), 2, 5)
+        self.assertEqual(grid.shape, (25, 2))
+        np.testing.assert_array_equal(grid[0], (58, 93))
+        np.testing.assert_array_equal(grid[-1], (62, 97))
+        np.testing.assert_array_equal(dsc_sweep.jitter_extents((1, 2), 2, 1),
+            [(1, 2)])
+
+    def test_sweep(self):
+        ret = dsc_sweep.sweep(self.data, 'peak', (225, 262), 1, 5,
+            (None, 11), jobs=1)
+        self.assertEqual(ret['evaluations'], 50)
+        self.assertEqual(ret['failures'], 0)
+        self.assertEqual(set(ret['stats']), set(dsc.PEAK_VALUES))
+        self.assertFalse(self.data.savgol_1_enabled)
+        self.assertEqual(dsc_sweep.sweep(self.data, 'peak', (225, 262), 1, 5,
+            (None, 11), jobs=2), ret)
+        ref = dsc.analysis_values(self.data,
+            dsc.run_analysis(self.data, 'tg', (60, 95)))
+        stats = dsc_sweep.sweep(self.data, 'tg', (60, 95), 0, 1,
+            jobs=1)['stats']
+        self.assertEqual({k: v['mean'] for k, v in stats.items()}, ref)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import dsc
+from tab_to_csv import convert
+from util import open_text
+
+class TestTabToCsv(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fi = os.path.join(self.dir, 'a.txt')
+        shutil.copy('example_tabulated.txt', self.fi)
+        with open_text(self.fi) as f:
+            self.data = dsc.read_tabulated_txt(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_csv(self):
+        out = convert(self.fi)
+        # Same output as writing one row at a time with csv.writer
+        with open(os.path.join(self.dir, 'ref.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Index', 't', 'Heatflow', 'Tr'])
+            writer.writerows(zip(*(getattr(self.data, col).tolist()
+                for col in dsc.COLUMNS)))
+        with open(out) as a, open(os.path.join(self.dir, 'ref.csv')) as b:
+            self.assertEqual(a.read(), b.read())
+        with self.assertRaises(Exception):
+            convert(self.fi)
+
+    def test_binary(self):
+        arr = np.load(convert(self.fi, 'npy'))
+        npz = np.load(convert(self.fi, 'npz'))
+        for col in dsc.COLUMNS:
+            np.testing.assert_array_equal(arr[col], getattr(self.data, col))
+            np.testing.assert_array_equal(npz[col], getattr(self.data, col))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import codecs
+import os
+import tempfile
+import unittest
+import numpy as np
+import util
+
+class TestUtil(unittest.TestCase):
+    def test_detect_encoding(self):
+        self.assertEqual(util.detect_encoding(codecs.BOM_UTF8 + b'Index'),
+            'utf-8-sig')
+        self.assertEqual(util.detect_encoding(codecs.BOM_UTF16_LE +
+            'Index'.encode('utf-16-le')), 'utf-16')
+        self.assertEqual(util.detect_encoding(b'Index t'), 'latin-1')
+
+    def test_open_text(self):
+        encoding = util.get_encoding_type('example_tabulated.txt')
+        with open('example_tabulated.txt', encoding=encoding) as f:
+            text = f.read()
+        with util.open_text('example_tabulated.txt') as f:
+            self.assertEqual(f.read(), text)
+
+    def test_utf8_notes(self):
+        # An ASCII head, then UTF-8 notes past the sniffed bytes
+        text = 'Index t\n' + '0 1\n'*util.ENCODING_SNIFF_BYTES + \
+            'Probe: 25 °C, Messung\u2013A\n'
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'run.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            with util.open_text(path) as f:
+                self.assertEqual(f.read(), text)
+            with open(path, 'w', encoding='latin-1') as f:
+                f.write(text.replace('\u2013', '-'))
+            with util.open_text(path) as f:
+                self.assertEqual(f.read(), text.replace('\u2013', '-'))
+        self.assertEqual(util.detect_encoding(b'Index t',
+            '\u00b0C'.encode('utf-8')[1:] + 'Messung \u00b0C'.encode()),
+            'utf-8')
+
+    def test_lru_cache(self):
+        cache = util.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1) # b is now least recently used
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1,
+            'evictions': 1, 'entries': 2, 'bytes': 0})
+        cache = util.LRUCache(10, max_bytes=100)
+        cache.put('a', np.zeros(8))
+        cache.put('b', np.zeros(8))
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.stats()['bytes'], 64)
+
+    def test_summary_stats(self):
+        stats = util.summary_stats([1, 2, np.nan, 3, 4, 5])
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(stats['mean'], 3)
+        self.assertEqual((stats['min'], stats['p50'], stats['max']),
+            (1, 3, 5))
+        self.assertEqual(util.summary_stats([])['count'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,106 @@
 # Miscellaneous utility functions
-from chardet import detect
+from chardet import UniversalDetector
+import codecs
+import glob
+import io
+import os
+import threading
 import numpy as np
 import unicodedata
+from collections import OrderedDict
 
-def get_encoding_type(fi):
-    with open(fi, 'rb') as f:
-        rawdata = f.read()
-        return detect(rawdata)['encoding']
+# Bytes at the start and at the end of a file examined when guessing its
+# encoding. Exports only have non-ASCII characters in their header (e.g. the
+# degree sign) and in the notes after the data, so the data rows need not be
+# scanned.
+ENCODING_SNIFF_BYTES = 1 << 16
+# Files whose detected encoding is remembered
+ENCODING_CACHE_ENTRIES = 1024
+# UTF-32 LE must be tested before UTF-16 LE, whose BOM is its prefix
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'), (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'))
+# Guesses the encoding of a file from its first bytes, head, and its last
+# ones not among them, tail
+def detect_encoding(head, tail=b''):
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    detector = UniversalDetector()
+    for line in head.splitlines(True):
+        detector.feed(line)
+        if detector.done:
+            break
+    detector.close()
+    encoding = detector.result['encoding']
+    if encoding is not None and encoding != 'ascii':
+        return encoding
+    # With an ASCII head, the notes at the end decide. The tail may start
+    # inside a character, so leading continuation bytes are skipped; latin-1
+    # decodes anything else.
+    if tail.isascii():
+        return 'latin-1'
+    tail = tail.lstrip(bytes(range(0x80, 0xc0)))
+    try:
+        tail.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'latin-1'
+    return 'utf-8'
+
+def get_encoding_type(fi, head=None):
+    st = os.stat(fi)
+    key = (os.path.abspath(fi), st.st_mtime_ns, st.st_size)
+    encoding = encoding_cache.get(key)
+    if encoding is None:
+        with open(fi, 'rb') as f:
+            if head is None:
+                head = f.read(ENCODING_SNIFF_BYTES)
+            tail = b''
+            if st.st_size > len(head):
+                f.seek(max(len(head), st.st_size - ENCODING_SNIFF_BYTES))
+                tail = f.read(ENCODING_SNIFF_BYTES)
+        encoding = detect_encoding(head, tail)
+        encoding_cache.put(key, encoding)
+    return encoding
+
+# Opens fi for reading as text in its detected encoding. The bytes at the
+# start used for detection stay in the read buffer and are decoded from
+# there, so only the tail is read twice.
+def open_text(fi):
+    f = open(fi, 'rb', buffering=ENCODING_SNIFF_BYTES)
+    try:
+        encoding = get_encoding_type(fi, f.peek(ENCODING_SNIFF_BYTES))
+    except BaseException:
+        f.close()
+        raise
+    return io.TextIOWrapper(f, encoding=encoding)
+
+# Percentiles reported by summary_stats
+SUMMARY_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Distribution of the finite values of arr: count, mean, std, min, max and
+# SUMMARY_PERCENTILES (as 'p5' etc.), NaN if there are none
+def summary_stats(arr):
+    arr = np.asarray(arr, dtype=np.float64).ravel()
+    arr = arr[np.isfinite(arr)]
+    ret = {'count': len(arr)}
+    if not len(arr):
+        arr = np.array([np.nan])
+    ret['mean'] = float(np.mean(arr))
+    ret['std'] = float(np.std(arr))
+    ret['min'] = float(np.min(arr))
+    ret['max'] = float(np.max(arr))
+    for p, v in zip(SUMMARY_PERCENTILES,
+            np.percentile(arr, SUMMARY_PERCENTILES)):
+        ret['p%d' % p] = float(v)
+    return ret
 
 def print_summary_stats(arr, name=None):
     if name:
         print("Summary stats for ",name)
-    print("Mean: ",np.mean(arr))
-    print("STD: ",np.std(arr))
+    stats = summary_stats(arr)
+    print("Mean: ",stats['mean'])
+    print("STD: ",stats['std'])
 
 def si_intersect(m1, m2, b1, b2):
     x = (b2-b1)/(m1-m2)
@@ -20,3 +108,79 @@ def si_intersect(m1, m2, b1, b2):
 
 def filter_control(str):
   return ''.join(c for c in str if unicodedata.category(c)[0] != "C")
+
+# Expands a list of files, directories and glob patterns into file paths.
+# Directories contribute the files in them ending with ext.
+def expand_inputs(inputs, ext='.txt'):
+    ret = []
+    for i in inputs:
+        if os.path.isdir(i):
+            ret += sorted(os.path.join(i, f) for f in os.listdir(i)
+                if f.lower().endswith(ext))
+        elif glob.has_magic(i):
+            ret += sorted(glob.glob(i))
+        else:
+            ret.append(i)
+    return ret
+
+# Bounded mapping that evicts the least recently used entries and counts
+# lookups; safe to share between threads. With max_bytes, the nbytes of the
+# values (e.g. arrays), as of when they were last put, are bounded too,
+# though the newest entry is always kept.
+class LRUCache:
+    def __init__(self, max_entries, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, _ = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries[key][1]
+            size = getattr(value, 'nbytes', 0)
+            self.entries[key] = (value, size)
+            self.entries.move_to_end(key)
+            self.nbytes += size
+            while len(self.entries) > self.max_entries or \
+                    len(self.entries) > 1 and self.max_bytes is not None and \
+                    self.nbytes > self.max_bytes:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.nbytes -= size
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self.entries),
+                'bytes': self.nbytes}
+
+# Detected encodings keyed by (path, mtime, size)
+encoding_cache = LRUCache(ENCODING_CACHE_ENTRIES)